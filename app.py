@@ -1,115 +1,590 @@
+"""
+Flask app factory. Importing this module only loads Flask and the small utils
+modules; the scrapers, Pillow and the poster pipeline are imported by the routes
+that use them, and all setup (folders, schema, caches) happens in create_app().
+
+    gunicorn 'app:create_app()'            # or: flask --app app run
+    WARM_UP=1 gunicorn --preload 'app:create_app()'
+
+With WARM_UP=1 the factory also loads fonts, the poster template and the
+sentiment model; under --preload that happens once in the master and the
+forked workers share it copy-on-write.
+"""
 import os
-from flask import Flask, render_template, request, redirect, url_for, send_from_directory
-from utils.poster_maker import generate_poster, extract_reviews, analyze_sentiment
-import sqlite3
+import gc
+import json
+import time
+import uuid
+import click
+import shutil
+import logging
+import functools
+import threading
+import multiprocessing
+from flask import Flask, Blueprint, current_app, render_template, request, redirect, url_for, send_from_directory, jsonify, Response, stream_with_context, stream_template, g
+from utils import db, jobs, layouts, metrics, profiler, sentiment
+from utils import log as logging_setup
 from werkzeug.utils import secure_filename
-from scraper import scrape_indiamart, scrape_flipkart, scrape_amazon
 
-app = Flask(__name__)
-app.config['UPLOAD_FOLDER'] = 'uploads'
-app.config['POSTER_FOLDER'] = 'static/posters'
-app.config['DATABASE'] = 'poster_maker.db'
+log = logging.getLogger(__name__)
+
+REQUEST_SECONDS = metrics.histogram('http_request_seconds', 'Time to build each response.', ('endpoint', 'method', 'status'))
+_sampler = profiler.Sampler()
+
+bp = Blueprint('main', __name__, cli_group=None)
+
+def create_app(config=None):
+    """Build the app: default config, then `config` overrides, then folders, schema and caches."""
+    from utils import page_cache, render_cache, store
+    app = Flask(__name__)
+    app.config['UPLOAD_FOLDER'] = 'uploads'
+    app.config['POSTER_FOLDER'] = 'static/posters'
+    app.config['BATCH_FOLDER'] = 'static/batches'
+    # Request body caps: one poster image plus the form fields, and a batch catalog with its
+    # images. Werkzeug answers larger bodies with 413 before anything is written to disk
+    app.config['MAX_CONTENT_LENGTH'] = render_cache.MAX_IMAGE_BYTES + 1024 * 1024
+    app.config['BATCH_MAX_CONTENT_LENGTH'] = 256 * 1024 * 1024
+    # Worker processes for batch rendering (None = one per CPU)
+    app.config['BATCH_WORKERS'] = None
+    app.config['DATABASE'] = 'poster_maker.db'
+    # Review fetching: thread pool size, concurrent requests per host, overall deadline (seconds)
+    app.config['REVIEW_WORKERS'] = 8
+    app.config['REVIEW_PER_HOST'] = 4
+    app.config['REVIEW_DEADLINE'] = 20.0
+    # Scraped page cache: in-memory byte cap, optional on-disk tier (set to None to disable) and its byte cap
+    app.config['PAGE_CACHE_MAX_BYTES'] = 64 * 1024 * 1024
+    app.config['PAGE_CACHE_DB'] = os.path.join(os.path.dirname(app.config['DATABASE']), 'page_cache.db')
+    app.config['PAGE_CACHE_DB_MAX_BYTES'] = 256 * 1024 * 1024
+    # Background jobs: 'thread' runs workers inside the web process, 'worker' leaves them to
+    # `flask jobs-worker` processes, 'eager' runs each job inline during the request
+    app.config['JOBS_MODE'] = os.environ.get('JOBS_MODE', 'thread')
+    # Maximum jobs of each type running at once, across all workers
+    app.config['JOB_CONCURRENCY'] = {'scrape': 4, 'poster': 2}
+    # Product store: seconds a stored search / a product's review sentiment is served without re-scraping
+    app.config['STORE_SEARCH_TTL'] = store.SEARCH_TTL
+    app.config['STORE_REVIEW_TTL'] = store.REVIEW_TTL
+    # Crawl mode (/scraper/crawl): default product cap, result pages followed, pages fetched at once
+    app.config['CRAWL_MAX_PRODUCTS'] = 200
+    app.config['CRAWL_MAX_PAGES'] = 10
+    app.config['CRAWL_CONCURRENCY'] = 4
+    # Requests slower than this (seconds) are logged; with PROFILE_SLOW_REQUESTS=1 every request is
+    # stack-sampled and slow ones log their hottest stacks
+    app.config['SLOW_REQUEST_SECONDS'] = float(os.environ.get('SLOW_REQUEST_SECONDS', 2.0))
+    app.config['PROFILE_SLOW_REQUESTS'] = os.environ.get('PROFILE_SLOW_REQUESTS') == '1'
+    # Load fonts, the poster template and the sentiment model at startup instead of on first use
+    app.config['WARM_UP'] = os.environ.get('WARM_UP') == '1'
+    app.config.update(config or {})
+
+    logging_setup.configure()
+    os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
+    os.makedirs(app.config['POSTER_FOLDER'], exist_ok=True)
+    os.makedirs(app.config['BATCH_FOLDER'], exist_ok=True)
+    db.migrate(app.config['DATABASE'])
+    page_cache.configure(max_bytes=app.config['PAGE_CACHE_MAX_BYTES'], db_path=app.config['PAGE_CACHE_DB'],
+                         disk_max_bytes=app.config['PAGE_CACHE_DB_MAX_BYTES'])
+
+    app.register_blueprint(bp)
+    app.teardown_appcontext(release_db_connection)
+    jobs.handler('poster')(_in_app_context(app, poster_job))
+    jobs.handler('scrape')(_in_app_context(app, scrape_job))
+    if app.config['WARM_UP']:
+        warm_up()
+    return app
 
-# Ensure folders exist
-os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
-os.makedirs(app.config['POSTER_FOLDER'], exist_ok=True)
+def warm_up():
+    """Load what the first poster and scrape requests would otherwise load, for every layout."""
+    start = time.perf_counter()
+    import requests  # noqa: F401
+    import scraper  # noqa: F401
+    from utils import batch, review_pipeline  # noqa: F401
+    from utils.render_context import prepare_layouts
+    prepare_layouts()
+    sentiment.warm()
+    # Keep the collector from touching everything loaded so far, so forked workers
+    # don't copy these pages just by running a GC pass
+    gc.freeze()
+    log.info('Warmed up', extra={'seconds': round(time.perf_counter() - start, 3)})
+
+def _in_app_context(app, fn):
+    """Job handlers run outside any request; give them current_app and the DB connection teardown."""
+    @functools.wraps(fn)
+    def run(payload):
+        with app.app_context():
+            return fn(payload)
+    return run
 
 def get_db_connection():
-    conn = sqlite3.connect(app.config['DATABASE'])
-    conn.row_factory = sqlite3.Row
-    return conn
+    """This thread's reused connection; uncommitted work is rolled back when the app context ends."""
+    return db.get_connection(current_app.config['DATABASE'])
+
+def release_db_connection(exc):
+    db.release(current_app.config['DATABASE'])
+
+@bp.before_app_request
+def start_request_timer():
+    g.request_start = time.perf_counter()
+    if current_app.config['PROFILE_SLOW_REQUESTS']:
+        _sampler.start()
+
+@bp.after_app_request
+def record_request(response):
+    start = g.pop('request_start', None)
+    if start is None:
+        return response
+    elapsed = time.perf_counter() - start
+    REQUEST_SECONDS.observe(elapsed, endpoint=request.endpoint or 'unknown', method=request.method, status=response.status_code)
+    samples = _sampler.stop() if current_app.config['PROFILE_SLOW_REQUESTS'] else None
+    if elapsed >= current_app.config['SLOW_REQUEST_SECONDS']:
+        extra = {'path': request.path, 'method': request.method, 'status': response.status_code, 'seconds': round(elapsed, 3)}
+        if samples:
+            extra['samples'] = sum(samples.values())
+            extra['top_stacks'] = profiler.top_stacks(samples)
+        log.warning('Slow request', extra=extra)
+    return response
+
+@bp.teardown_app_request
+def stop_request_sampler(exc):
+    # after_request is skipped when a request fails hard; never leave a thread being sampled
+    if current_app.config['PROFILE_SLOW_REQUESTS']:
+        _sampler.stop(threading.get_ident())
+
+def submit_job(job_type, payload):
+    """Queue a job (or reuse an identical in-flight one) and make sure something will run it."""
+    job_id = jobs.enqueue(current_app.config['DATABASE'], job_type, payload)
+    mode = current_app.config['JOBS_MODE']
+    if mode == 'eager':
+        jobs.run_inline(current_app.config['DATABASE'], job_id)
+    elif mode == 'thread':
+        limits = current_app.config['JOB_CONCURRENCY']
+        jobs.start_thread_workers(current_app.config['DATABASE'], limits, sum(limits.values()))
+    return job_id
+
+def job_view(job_id):
+    """(job, finished) for a job id from the query string; job is None if unknown."""
+    job = jobs.get(current_app.config['DATABASE'], job_id)
+    return job, job is not None and job['status'] in (jobs.DONE, jobs.FAILED)
 
-def init_db():
+def find_rendered_poster(conn, product_name, price, description, image_path, layout, record=True):
+    """(render_key, existing posters row or None) for these poster inputs."""
+    from utils import render_cache
+    key = render_cache.render_key(product_name, price, description, image_path, layout)
+    return key, render_cache.lookup(conn, key, current_app.config['POSTER_FOLDER'], record=record)
+
+def poster_job(payload):
+    from utils.poster_maker import generate_poster
+    from utils.render_context import POSTER_STAGE_SECONDS
     conn = get_db_connection()
-    conn.execute('''CREATE TABLE IF NOT EXISTS posters (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        product_name TEXT,
-        price TEXT,
-        description TEXT,
-        image_filename TEXT,
-        poster_filename TEXT,
-        caption TEXT
-    )''')
-    conn.commit()
-    conn.close()
-
-init_db()
-
-@app.route('/', methods=['GET', 'POST'])
-@app.route('/poster', methods=['GET', 'POST'])
+    layout = payload.get('layout') or layouts.DEFAULT_LAYOUT
+    # The route already looked this up; re-check in case an identical job finished meanwhile
+    key, existing = find_rendered_poster(conn, payload['product_name'], payload['price'], payload['description'],
+                                         payload['image_path'], layout, record=False)
+    if existing is not None:
+        return {'poster_filename': existing['poster_filename'], 'caption': existing['caption']}
+    poster_filename, caption = generate_poster(payload['product_name'], payload['price'], payload['description'], payload['image_path'],
+                                               layout=layout)
+    with POSTER_STAGE_SECONDS.time(stage='db'):
+        conn.execute('INSERT INTO posters (product_name, price, description, image_filename, poster_filename, caption, render_key, layout, created_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                     (payload['product_name'], payload['price'], payload['description'], payload['image_filename'], poster_filename, caption, key, layout, time.time()))
+        conn.commit()
+    return {'poster_filename': poster_filename, 'caption': caption}
+
+def render_poster_result(poster_filename, caption):
+    """Poster page showing a rendered poster: responsive preview, PNG download."""
+    from utils import poster_variants
+    srcset = [(url_for('main.poster_image', filename=poster_filename, w=w), w) for w in poster_variants.RESPONSIVE_WIDTHS]
+    return render_template('poster.html', poster_url=url_for('static', filename=f'posters/{poster_filename}'),
+                           preview_url=url_for('main.poster_image', filename=poster_filename), preview_srcset=srcset, caption=caption)
+
+@bp.app_context_processor
+def inject_layouts():
+    return {'poster_layouts': layouts.available(), 'default_layout': layouts.DEFAULT_LAYOUT}
+
+@bp.route('/', methods=['GET', 'POST'])
+@bp.errorhandler(413)
+def request_too_large(e):
+    message = f'Upload is too large; the limit is {request.max_content_length // (1024 * 1024)} MB.'
+    if request.endpoint == 'main.poster':
+        return render_template('poster.html', upload_error=message), 413
+    return jsonify({'error': message}), 413
+
+@bp.route('/poster', methods=['GET', 'POST'])
 def poster():
+    from utils import render_cache, image_ingest
     if request.method == 'POST':
         product_name = request.form['product_name']
         price = request.form['price']
         description = request.form['description']
+        layout = request.form.get('layout') or layouts.DEFAULT_LAYOUT
+        try:
+            layouts.load_layout(layout)
+        except layouts.LayoutError as e:
+            return render_template('poster.html', upload_error=str(e)), 400
         image = request.files['image']
         if image and image.filename:
-            image_filename = secure_filename(image.filename)
-            image_path = os.path.join(app.config['UPLOAD_FOLDER'], image_filename)
-            image.save(image_path)
+            # Stored under its content hash, so re-uploading the same image reuses the file
+            image_filename, image_path = render_cache.store_upload(image, current_app.config['UPLOAD_FOLDER'])
+            # Reject oversized or undecodable images before any worker decodes them
+            try:
+                image_ingest.validate(image_path)
+            except image_ingest.ImageError as e:
+                os.remove(image_path)
+                return render_template('poster.html', upload_error=str(e)), 400
         else:
             image_filename = None
             image_path = None
-        poster_filename, caption = generate_poster(product_name, price, description, image_path)
-        conn = get_db_connection()
-        conn.execute('INSERT INTO posters (product_name, price, description, image_filename, poster_filename, caption) VALUES (?, ?, ?, ?, ?, ?)',
-                     (product_name, price, description, image_filename, poster_filename, caption))
-        conn.commit()
-        conn.close()
-        return render_template('poster.html', poster_url=url_for('static', filename=f'posters/{poster_filename}'), caption=caption)
+        _, existing = find_rendered_poster(get_db_connection(), product_name, price, description, image_path, layout)
+        if existing is not None:
+            return render_poster_result(existing['poster_filename'], existing['caption'])
+        job_id = submit_job('poster', {'product_name': product_name, 'price': price, 'description': description,
+                                       'image_filename': image_filename, 'image_path': image_path, 'layout': layout})
+        return redirect(url_for('main.poster', job=job_id))
+    job_id = request.args.get('job')
+    if job_id:
+        job, finished = job_view(job_id)
+        if job is None:
+            return render_template('poster.html', job_error='Unknown job.'), 404
+        if not finished:
+            return render_template('poster.html', job_id=job_id)
+        if job['status'] == jobs.FAILED:
+            return render_template('poster.html', job_error=f"Poster generation failed: {job['error']}")
+        result = job['result']
+        return render_poster_result(result['poster_filename'], result['caption'])
     return render_template('poster.html')
 
-@app.route('/scraper', methods=['GET', 'POST'])
-def scraper():
+@bp.route('/poster-image/<filename>')
+def poster_image(filename):
+    """
+    Serve a poster in the best format the client accepts (WebP, JPEG, PNG) and
+    the smallest variant covering ?w=. Variants never change once written, so
+    they are cacheable forever, with an ETag taken from the file's name, size and
+    mtime (nothing to hash or remember per file); ranges are supported.
+    """
+    from utils import poster_variants
+    filename = secure_filename(filename)
+    folder = current_app.config['POSTER_FOLDER']
+    if not (filename.startswith('poster_') and filename.endswith('.png')) or not os.path.isfile(os.path.join(folder, filename)):
+        return jsonify({'error': 'Unknown poster.'}), 404
+    fmt = request.args.get('format')
+    if fmt not in poster_variants.FORMATS:
+        fmt = poster_variants.negotiate(request.accept_mimetypes)
+    if fmt == 'png':
+        name = filename
+    else:
+        name = poster_variants.variant_name(filename, fmt, poster_variants.pick_width(request.args.get('w', type=int)))
+        if not os.path.isfile(os.path.join(folder, name)):
+            poster_variants.ensure_variants(folder, filename)
+    st = os.stat(os.path.join(folder, name))
+    response = send_from_directory(folder, name, mimetype=poster_variants.FORMATS[fmt]['mimetype'],
+                                   etag=f'{os.path.splitext(name)[0]}-{st.st_size:x}-{st.st_mtime_ns:x}',
+                                   conditional=True, max_age=365 * 24 * 60 * 60)
+    response.cache_control.immutable = True
+    response.vary.add('Accept')
+    return response
+
+@bp.route('/posters')
+def poster_history():
+    """
+    Generated posters, newest first, as JSON. Keyset-paginated: pass the returned
+    'next_before' as ?before= for the next page, so deep pages cost the same as the first.
+    Optional ?product= filters by exact product name.
+    """
+    limit = min(max(request.args.get('limit', 20, type=int), 1), 100)
+    before = request.args.get('before', type=int)
+    product = request.args.get('product')
+    where, params = [], []
+    if before is not None:
+        where.append('id < ?')
+        params.append(before)
+    if product:
+        where.append('product_name = ?')
+        params.append(product)
+    sql = 'SELECT id, product_name, price, description, layout, poster_filename, caption, created_at FROM posters'
+    if where:
+        sql += ' WHERE ' + ' AND '.join(where)
+    sql += ' ORDER BY id DESC LIMIT ?'
+    rows = get_db_connection().execute(sql, (*params, limit + 1)).fetchall()
+    posters = []
+    for row in rows[:limit]:
+        item = dict(row)
+        item['poster_url'] = url_for('static', filename=f"posters/{row['poster_filename']}")
+        item['image_url'] = url_for('main.poster_image', filename=row['poster_filename'])
+        posters.append(item)
+    next_before = posters[-1]['id'] if len(rows) > limit else None
+    return jsonify({'posters': posters, 'next_before': next_before})
+
+def _upload_resolver(*search_dirs, uploaded=None):
+    """
+    Map a catalog image name to a file uploaded with this request (`uploaded`:
+    original name -> stored path), else to one inside `search_dirs`, never outside them.
+    """
+    def resolve(name):
+        filename = secure_filename(os.path.basename(name))
+        if uploaded and filename in uploaded:
+            return uploaded[filename]
+        for folder in search_dirs:
+            path = os.path.join(folder, filename)
+            if filename and os.path.isfile(path):
+                return path
+        return None
+    return resolve
+
+def _run_batch(rows, resolve_image, workers):
+    """Render a catalog, yielding progress dicts, then store and zip the results."""
+    from utils import batch, render_cache
+    from utils.render_context import POSTER_STAGE_SECONDS
+    batch_id = uuid.uuid4().hex[:8]
+    results = []
+    yield {'event': 'start', 'batch_id': batch_id, 'total': len(rows)}
+    conn = get_db_connection()
+    # Rows already rendered with the same inputs, template and fonts reuse their poster
+    def cached(key):
+        return render_cache.lookup(conn, key, current_app.config['POSTER_FOLDER'])
+    for result in batch.render_batch(rows, resolve_image, workers=workers, cached=cached):
+        results.append(result)
+        yield {'event': 'progress', 'done': len(results), 'total': len(rows), 'index': result['index'],
+               'poster_filename': result['poster_filename'], 'cached': result['cached'], 'error': result['error']}
+    with POSTER_STAGE_SECONDS.time(stage='db'):
+        saved = batch.save_posters(conn, results)
+    zip_path = os.path.join(current_app.config['BATCH_FOLDER'], f'batch_{batch_id}.zip')
+    batch.write_zip(results, current_app.config['POSTER_FOLDER'], zip_path)
+    yield {'event': 'done', 'batch_id': batch_id, 'saved': saved, 'cached': sum(1 for r in results if r['cached']),
+           'failed': sum(1 for r in results if r['error']), 'zip_path': zip_path}
+
+@bp.route('/poster/batch', methods=['POST'])
+def poster_batch():
+    """
+    Render a CSV/JSON catalog of product_name, price, description, image rows.
+    Images referenced by name may be uploaded alongside as 'images'.
+    Streams NDJSON progress; the final line carries the ZIP download URL.
+    """
+    from utils import batch, render_cache, image_ingest
+    request.max_content_length = current_app.config['BATCH_MAX_CONTENT_LENGTH']
+    catalog = request.files.get('catalog')
+    if not catalog:
+        return jsonify({'error': 'Upload a CSV or JSON catalog as "catalog".'}), 400
+    try:
+        rows = batch.load_catalog(catalog.read(), catalog.filename or '')
+    except batch.CatalogError as e:
+        return jsonify({'error': str(e)}), 400
+    # Stored under their content hash like /poster uploads, so concurrent batches with the
+    # same file names never overwrite each other; rows find them by their original name
+    uploaded = {}
+    for image in request.files.getlist('images'):
+        if image and image.filename:
+            name = secure_filename(os.path.basename(image.filename))
+            _, path = render_cache.store_upload(image, current_app.config['UPLOAD_FOLDER'])
+            try:
+                image_ingest.validate(path)
+            except image_ingest.ImageError as e:
+                os.remove(path)
+                return jsonify({'error': f'{name}: {e}'}), 400
+            uploaded[name] = path
+    resolve_image = _upload_resolver(current_app.config['UPLOAD_FOLDER'], uploaded=uploaded)
+
+    def generate():
+        for event in _run_batch(rows, resolve_image, current_app.config['BATCH_WORKERS']):
+            if event['event'] == 'done':
+                event['zip_url'] = url_for('main.poster_batch_zip', batch_id=event.pop('batch_id'))
+                event.pop('zip_path')
+            yield json.dumps(event) + '\n'
+
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+@bp.route('/poster/batch/<batch_id>.zip')
+def poster_batch_zip(batch_id):
+    return send_from_directory(current_app.config['BATCH_FOLDER'], f'batch_{secure_filename(batch_id)}.zip', as_attachment=True)
+
+@bp.cli.command('batch-posters')
+@click.argument('catalog', type=click.Path(exists=True, dir_okay=False))
+@click.option('--workers', type=int, default=None, help='Render processes (default: one per CPU).')
+@click.option('--zip', 'zip_out', type=click.Path(dir_okay=False), default=None, help='Copy the result ZIP here.')
+def batch_posters_command(catalog, workers, zip_out):
+    """Render every row of a CSV/JSON CATALOG into posters."""
+    from utils import batch
+    with open(catalog, 'rb') as f:
+        rows = batch.load_catalog(f.read(), catalog)
+    resolve_image = _upload_resolver(os.path.dirname(os.path.abspath(catalog)), current_app.config['UPLOAD_FOLDER'])
+    for event in _run_batch(rows, resolve_image, workers):
+        if event['event'] == 'progress':
+            status = event['error'] or event['poster_filename'] + (' (cached)' if event['cached'] else '')
+            click.echo(f"[{event['done']}/{event['total']}] row {event['index'] + 1}: {status}")
+        elif event['event'] == 'done':
+            zip_path = event['zip_path']
+            if zip_out:
+                # --zip may be on another filesystem, where a rename fails
+                shutil.move(zip_path, zip_out)
+                zip_path = zip_out
+            click.echo(f"Saved {event['saved']} poster(s), reused {event['cached']}, {event['failed']} failed. ZIP: {zip_path}")
+
+def get_product_store(conn):
+    from utils import store
+    return store.ProductStore(conn, search_ttl=current_app.config['STORE_SEARCH_TTL'], review_ttl=current_app.config['STORE_REVIEW_TTL'])
+
+def scrape_job(payload):
+    from scraper import scrape_indiamart, scrape_flipkart, scrape_amazon
+    from utils.review_pipeline import score_products
+    competitor_url = payload['url']
     products = []
     scrape_message = None
+    conn = get_db_connection()
+    product_store = get_product_store(conn)
+    try:
+        if 'indiamart' in competitor_url:
+            products = scrape_indiamart(competitor_url)
+        elif 'flipkart' in competitor_url:
+            result = scrape_flipkart(competitor_url)
+            if isinstance(result, dict):
+                products = result.get('products', [])
+                if result.get('error'):
+                    scrape_message = result['error']
+            else:
+                products = result
+        elif 'amazon' in competitor_url:
+            products = scrape_amazon(competitor_url)
+        else:
+            scrape_message = 'Only IndiaMART, Flipkart, and Amazon URLs are supported for now.'
+        product_store.upsert_products(products)
+        # Only products whose stored sentiment is stale get their reviews re-fetched,
+        # concurrently; only reviews not seen before are scored
+        stale = product_store.attach_fresh_sentiment(products)
+        score_products(stale,
+                       max_workers=current_app.config['REVIEW_WORKERS'],
+                       per_host=current_app.config['REVIEW_PER_HOST'],
+                       deadline=current_app.config['REVIEW_DEADLINE'],
+                       scorer=product_store.score_reviews)
+        if not products and not scrape_message:
+            scrape_message = 'No products found or page structure changed.'
+        if products:
+            product_store.record_search(competitor_url, products, scrape_message)
+    except Exception as e:
+        scrape_message = f'Error scraping: {e}'
+    return {'products': products, 'scrape_message': scrape_message}
+
+@bp.route('/scraper', methods=['GET', 'POST'])
+def scraper():
     if request.method == 'POST':
         competitor_url = request.form.get('competitor_url')
-        if competitor_url:
-            try:
-                if 'indiamart' in competitor_url:
-                    products = scrape_indiamart(competitor_url)
-                elif 'flipkart' in competitor_url:
-                    result = scrape_flipkart(competitor_url)
-                    if isinstance(result, dict):
-                        products = result.get('products', [])
-                        if result.get('error'):
-                            scrape_message = result['error']
-                    else:
-                        products = result
-                elif 'amazon' in competitor_url:
-                    products = scrape_amazon(competitor_url)
-                else:
-                    scrape_message = 'Only IndiaMART, Flipkart, and Amazon URLs are supported for now.'
-                # For each product, extract reviews and compute sentiment
-                for idx, p in enumerate(products):
-                    product_url = p.get('product_url')
-                    platform = p.get('platform')
-                    try:
-                        reviews = extract_reviews(product_url, platform)
-                        used_mock = False
-                        if not reviews and platform and platform.lower() in ('flipkart', 'amazon'):
-                            print(f"[DEBUG] No real reviews found for {p.get('name')}, using mock reviews.")
-                            reviews = extract_reviews(None, 'indiamart')
-                            used_mock = True
-                        else:
-                            print(f"[DEBUG] Using real reviews for {p.get('name')}, count: {len(reviews)}")
-                        sentiment, _ = analyze_sentiment(reviews)
-                        if isinstance(sentiment, float):
-                            p['sentiment'] = {'positive': 0.0, 'negative': 0.0, 'neutral': 1.0, 'avg': sentiment}
-                        else:
-                            p['sentiment'] = sentiment
-                        print(f"[DEBUG] {p.get('name')} | Sentiment: {p['sentiment']} | Source: {'mock' if used_mock else 'real'}")
-                    except Exception as e:
-                        print(f"[ERROR] Sentiment extraction failed for {p.get('name')}: {e}")
-                        p['sentiment'] = {'positive': 0.0, 'negative': 0.0, 'neutral': 1.0, 'avg': 0.0}
-                if not products and not scrape_message:
-                    scrape_message = 'No products found or page structure changed.'
-            except Exception as e:
-                scrape_message = f'Error scraping: {e}'
-        else:
-            scrape_message = 'Please enter a valid URL.'
-    return render_template('scraper.html', products=products, scrape_message=scrape_message)
+        if not competitor_url:
+            return render_template('scraper.html', products=[], scrape_message='Please enter a valid URL.')
+        stored = get_product_store(get_db_connection()).fresh_search(competitor_url)
+        if stored is not None:
+            products, scrape_message = stored
+            return render_template('scraper.html', products=products, scrape_message=scrape_message)
+        job_id = submit_job('scrape', {'url': competitor_url})
+        return redirect(url_for('main.scraper', job=job_id))
+    job_id = request.args.get('job')
+    if job_id:
+        job, finished = job_view(job_id)
+        if job is None:
+            return render_template('scraper.html', products=[], scrape_message='Unknown job.'), 404
+        if not finished:
+            return render_template('scraper.html', products=[], job_id=job_id)
+        if job['status'] == jobs.FAILED:
+            return render_template('scraper.html', products=[], scrape_message=f"Error scraping: {job['error']}")
+        return render_template('scraper.html', **job['result'])
+    return render_template('scraper.html', products=[], scrape_message=None)
+
+@bp.route('/scraper/crawl')
+def scraper_crawl():
+    """
+    Follow a search's result pages past the 10-product cap and stream products as
+    each page arrives: NDJSON (one product per line, ?format=ndjson or an
+    application/x-ndjson Accept header) or a progressively rendered HTML table.
+    Every page is saved to the product store; sentiment is not scored here.
+    """
+    from scraper import crawl_pages, CRAWL_MAX_PRODUCTS
+    from utils import page_cache
+    competitor_url = request.args.get('competitor_url') or request.args.get('url')
+    if not competitor_url or page_cache.platform_of(competitor_url) is None:
+        return jsonify({'error': 'Pass an IndiaMART, Flipkart or Amazon search URL as "url".'}), 400
+    limit = min(request.args.get('limit', current_app.config['CRAWL_MAX_PRODUCTS'], type=int), CRAWL_MAX_PRODUCTS)
+    pages = crawl_pages(competitor_url, max_products=max(1, limit), max_pages=current_app.config['CRAWL_MAX_PAGES'],
+                        concurrency=current_app.config['CRAWL_CONCURRENCY'])
+
+    def stored(pages):
+        for page, products, error in pages:
+            if products:
+                get_product_store(get_db_connection()).upsert_products(products)
+            yield page, products, error
+
+    headers = {'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    wants_ndjson = request.args.get('format') == 'ndjson' or \
+        request.accept_mimetypes.best_match(['text/html', 'application/x-ndjson']) == 'application/x-ndjson'
+    if wants_ndjson:
+        def generate():
+            for page, products, error in stored(pages):
+                for p in products:
+                    yield json.dumps(dict(p, page=page)) + '\n'
+                if error:
+                    yield json.dumps({'error': error, 'page': page}) + '\n'
+        return Response(stream_with_context(generate()), mimetype='application/x-ndjson', headers=headers)
+    return Response(stream_template('crawl.html', pages=stored(pages), competitor_url=competitor_url, limit=limit),
+                    headers=headers)
+
+@bp.route('/jobs/<job_id>')
+def job_status(job_id):
+    job = jobs.get(current_app.config['DATABASE'], job_id)
+    if job is None:
+        return jsonify({'error': 'Unknown job.'}), 404
+    return jsonify({key: job[key] for key in ('id', 'type', 'status', 'error', 'result', 'created_at', 'started_at', 'finished_at')})
+
+@bp.route('/jobs/<job_id>/events')
+def job_events(job_id):
+    """Server-sent events: one 'status' event per change until the job finishes."""
+    # Read outside the generator: it runs after the request context is gone
+    db_path = current_app.config['DATABASE']
+
+    def stream():
+        last = None
+        while True:
+            job = jobs.get(db_path, job_id)
+            status = job['status'] if job else 'unknown'
+            if status != last:
+                yield f"event: status\ndata: {json.dumps({'id': job_id, 'status': status})}\n\n"
+                last = status
+            if status in (jobs.DONE, jobs.FAILED, 'unknown'):
+                return
+            time.sleep(jobs.POLL_INTERVAL)
+    return Response(stream(), mimetype='text/event-stream', headers={'Cache-Control': 'no-cache'})
+
+@bp.cli.command('jobs-worker')
+@click.option('--processes', type=int, default=None, help='Worker processes (default: sum of JOB_CONCURRENCY).')
+def jobs_worker_command(processes):
+    """Run background job workers until interrupted."""
+    db_path = current_app.config['DATABASE']
+    limits = current_app.config['JOB_CONCURRENCY']
+    processes = processes or sum(limits.values())
+    requeued = jobs.requeue_stale(db_path)
+    click.echo(f"Starting {processes} job worker(s), limits {limits}, requeued {requeued} stale job(s).")
+
+    def start_worker():
+        worker = multiprocessing.Process(target=jobs.run_worker, args=(db_path, limits), daemon=True)
+        worker.start()
+        return worker
+
+    workers = [start_worker() for _ in range(processes)]
+    try:
+        # Replace workers that die; their running jobs are requeued once their heartbeat goes stale
+        while True:
+            for i, worker in enumerate(workers):
+                if not worker.is_alive():
+                    log.warning('Job worker exited, restarting', extra={'pid': worker.pid, 'exitcode': worker.exitcode})
+                    workers[i] = start_worker()
+            time.sleep(1)
+    except KeyboardInterrupt:
+        for worker in workers:
+            worker.terminate()
+
+@bp.route('/metrics')
+def metrics_endpoint():
+    """Prometheus scrape endpoint for this process's counters and histograms."""
+    return Response(metrics.render(), content_type=metrics.CONTENT_TYPE)
+
+@bp.route('/cache/stats')
+def cache_stats():
+    from utils import http_client, page_cache, render_cache, image_ingest
+    return jsonify({'pages': page_cache.stats(), 'renders': render_cache.stats(), 'images': image_ingest.stats(),
+                    'hosts': http_client.stats()})
 
 if __name__ == '__main__':
-    app.run(debug=True) 
\ No newline at end of file
+    create_app().run(debug=True) 
\ No newline at end of file
@@ -0,0 +1,396 @@
+"""
+Offline benchmarks for the scrapers, sentiment scoring and poster rendering.
+
+Startup is timed in fresh interpreters (import, create_app, first request).
+All HTTP traffic is answered from the checked-in HTML fixtures by a stub
+transport adapter, so no network access is needed. Results are written as
+JSON so two runs can be compared:
+
+    python benchmarks/bench.py                      # run, write benchmarks/results/bench-<time>.json
+    python benchmarks/bench.py --quick              # fewer iterations
+    python benchmarks/bench.py --compare old.json new.json
+"""
+import argparse
+import gzip
+import io
+import json
+import os
+import platform
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from urllib.parse import urlsplit, parse_qs
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import requests  # noqa: E402
+from requests.adapters import BaseAdapter  # noqa: E402
+
+# Search query -> fixture served for that platform
+FIXTURES = {
+    'flipkart': {
+        'redmi note 13': 'flipkart_sample.html',
+        'iphone 15': 'flipkart_iphone15.html',
+        'iphone 16': 'flipkart_iphone16.html',
+        'boat airdopes': 'flipkart_boatairdopes.html',
+        'samsung s24': 'flipkart_samsungs24.html',
+    },
+    'amazon': {
+        'redmi note 13': 'amazon_sample.html',
+    },
+    'indiamart': {
+        'redmi note 13': 'indiamart_sample.html',
+    },
+}
+SEARCH_URLS = {
+    'flipkart': 'https://www.flipkart.com/search?q={q}',
+    'amazon': 'https://www.amazon.in/s?k={q}',
+    'indiamart': 'https://dir.indiamart.com/search.mp?ss={q}',
+}
+PARSE_CASES = [
+    ('flipkart_sample.html', 'flipkart'),
+    ('flipkart_iphone15.html', 'flipkart'),
+    ('flipkart_iphone16.html', 'flipkart'),
+    ('amazon_sample.html', 'amazon'),
+    ('indiamart_sample.html', 'indiamart'),
+]
+
+_fixture_cache = {}
+
+
+def load_fixture(name):
+    """Fixture text; some captures are stored gzip-compressed."""
+    if name not in _fixture_cache:
+        with open(os.path.join(ROOT, name), 'rb') as f:
+            data = f.read()
+        if data[:2] == b'\x1f\x8b':
+            data = gzip.decompress(data)
+        _fixture_cache[name] = data.decode('utf-8')
+    return _fixture_cache[name]
+
+
+class FixtureAdapter(BaseAdapter):
+    """
+    requests transport that answers from the fixtures instead of the network.
+    Search URLs map to the fixture for their query; product pages get the
+    platform's first fixture, which exercises a full fetch + parse with no reviews.
+    """
+
+    def __init__(self, latency=0.0):
+        super().__init__()
+        self.latency = latency
+        self.requests = 0
+
+    def send(self, request, **kwargs):
+        self.requests += 1
+        if self.latency:
+            time.sleep(self.latency)
+        parts = urlsplit(request.url)
+        host = parts.netloc
+        platform_name = next((p for p in FIXTURES if p in host), None)
+        resp = requests.Response()
+        resp.url = request.url
+        resp.request = request
+        resp.headers['Content-Type'] = 'text/html; charset=utf-8'
+        resp.encoding = 'utf-8'
+        if platform_name is None:
+            resp.status_code = 404
+            resp.raw = io.BytesIO(b'')
+            return resp
+        query = parse_qs(parts.query)
+        term = (query.get('q') or query.get('k') or query.get('ss') or [''])[0].lower()
+        fixtures = FIXTURES[platform_name]
+        name = fixtures.get(term) or next(iter(fixtures.values()))
+        resp.status_code = 200
+        resp.raw = io.BytesIO(load_fixture(name).encode('utf-8'))
+        return resp
+
+    def close(self):
+        pass
+
+
+def percentiles(samples):
+    ordered = sorted(samples)
+    if not ordered:
+        return {}
+
+    def pick(q):
+        return ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))]
+    return {
+        'n': len(ordered),
+        'mean_ms': sum(ordered) / len(ordered) * 1000,
+        'p50_ms': pick(0.50) * 1000,
+        'p95_ms': pick(0.95) * 1000,
+        'max_ms': ordered[-1] * 1000,
+    }
+
+
+def peak_rss_mb():
+    # ru_maxrss is KiB on Linux and bytes on macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / (1024 * 1024) if sys.platform == 'darwin' else rss / 1024
+
+
+def timed(fn, iterations):
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def install_stub(latency=0.0):
+    """Route the shared HTTP client through the fixture adapter."""
+    from utils import http_client
+    http_client.HOST_MIN_INTERVAL = 0
+    session = http_client.get_session()
+    adapter = FixtureAdapter(latency=latency)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return adapter
+
+
+def bench_parse(iterations):
+    from utils import extract
+    parsers = {
+        'flipkart': lambda html, backend: extract.parse_flipkart(html, backend=backend),
+        'amazon': lambda html, backend: extract.parse_amazon(html, backend=backend),
+        'indiamart': lambda html, backend: extract.parse_indiamart(html, backend=backend),
+    }
+    results = {}
+    for name, platform_name in PARSE_CASES:
+        html = load_fixture(name)
+        entry = {'bytes': len(html.encode('utf-8'))}
+        for backend in ('lxml', 'bs4'):
+            samples = timed(lambda: parsers[platform_name](html, backend), iterations)
+            entry[backend] = percentiles(samples)
+        results[name] = entry
+    return results
+
+
+def bench_scraper_route(iterations, latency):
+    from utils import page_cache
+    import app as app_module
+    # Run jobs inside the request so the measurement covers the whole scrape. cold/warm
+    # (page cache empty/primed) keep nothing in the product store so every run scrapes;
+    # store is a repeat search answered from the product store
+    scrape_client = app_module.create_app({'JOBS_MODE': 'eager', 'STORE_SEARCH_TTL': 0, 'STORE_REVIEW_TTL': 0}).test_client()
+    store_client = app_module.create_app({'JOBS_MODE': 'eager'}).test_client()
+    results = {}
+    for platform_name, template in SEARCH_URLS.items():
+        url = template.format(q='redmi+note+13')
+        for mode in ('cold', 'warm', 'store'):
+            client = store_client if mode == 'store' else scrape_client
+
+            def run():
+                if mode == 'cold':
+                    page_cache.configure(max_bytes=page_cache.MAX_MEMORY_BYTES)
+                resp = client.post('/scraper', data={'competitor_url': url}, follow_redirects=True)
+                assert resp.status_code == 200, resp.status_code
+            run()  # prime imports and, for warm and store runs, the caches
+            results[f'{platform_name}_{mode}'] = percentiles(timed(run, iterations))
+    results['stub_latency_ms'] = latency * 1000
+    return results
+
+
+# Timed in a fresh interpreter: importing app, create_app(), then one poster request
+# (eager job, so it includes loading the template and fonts unless warmed up)
+STARTUP_SCRIPT = """
+import io, json, sys, time
+sys.path.insert(0, sys.argv[1])
+start = time.perf_counter()
+import app
+imported = time.perf_counter()
+application = app.create_app({'JOBS_MODE': 'eager'})
+created = time.perf_counter()
+resp = application.test_client().post('/poster', data={
+    'product_name': 'Startup ' + sys.argv[2], 'price': '99', 'description': 'First request after start',
+    'image': (io.BytesIO(b''), '')})
+assert resp.status_code == 302, resp.status_code
+done = time.perf_counter()
+print(json.dumps({'import': imported - start, 'create_app': created - imported, 'first_request': done - created}))
+"""
+
+
+def bench_startup(runs):
+    results = {}
+    for mode in ('lazy', 'warm_up'):
+        env = dict(os.environ, WARM_UP='1' if mode == 'warm_up' else '0', LOG_LEVEL='WARNING')
+        samples = {}
+        for i in range(runs):
+            out = subprocess.check_output([sys.executable, '-c', STARTUP_SCRIPT, ROOT, f'{mode} {i}'], env=env, text=True)
+            for stage, seconds in json.loads(out.strip().splitlines()[-1]).items():
+                samples.setdefault(stage, []).append(seconds)
+        results[mode] = {stage: percentiles(values) for stage, values in samples.items()}
+    return results
+
+
+def bench_sentiment(rounds):
+    from utils.poster_maker import analyze_sentiment, extract_reviews
+    from utils import sentiment
+    reviews = []
+    for _ in range(rounds):
+        reviews.extend(extract_reviews(None, 'indiamart'))
+    try:
+        analyze_sentiment(reviews[:1])
+    except Exception as e:
+        return {'error': f'{type(e).__name__}: {e}'}
+    engine = sentiment.get_engine()
+    results = {'backend': engine.backend.name, 'reviews': len(reviews)}
+    for mode in ('cold', 'memoised'):
+        samples = []
+        for i in range(0, len(reviews), 20):
+            if mode == 'cold':
+                engine.clear()
+            batch = reviews[i:i + 20]
+            start = time.perf_counter()
+            analyze_sentiment(batch)
+            samples.append(time.perf_counter() - start)
+        total = sum(samples)
+        results[mode] = {
+            'reviews_per_sec': len(reviews) / total if total else None,
+            'per_batch_of_20': percentiles(samples),
+        }
+    return results
+
+
+def bench_posters(iterations):
+    from utils.poster_maker import generate_poster
+    image = os.path.join(ROOT, 'uploads', 'boat.png')
+    cases = [
+        ('boAt Airdopes 141', '₹1,299', 'Bluetooth earbuds with 42 hours playback and ENx noise cancellation', image),
+        ('Apple iPhone 16 Pro Max (Desert Titanium, 256 GB) with a long product title', '₹1,44,900',
+         'A18 Pro chip, 48MP Fusion camera, 6.9 inch Super Retina XDR display and all-day battery life', image),
+        ('Plain poster', '₹99', 'No product image on this one', None),
+    ]
+    generate_poster(*cases[0])  # warm-up
+    samples = []
+    for i in range(iterations):
+        start = time.perf_counter()
+        generate_poster(*cases[i % len(cases)])
+        samples.append(time.perf_counter() - start)
+    total = sum(samples)
+    return {
+        'posters_per_sec': iterations / total if total else None,
+        'latency': percentiles(samples),
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, text=True,
+                                       stderr=subprocess.DEVNULL).strip()
+    except Exception:
+        return None
+
+
+def make_workspace():
+    """
+    Scratch directory holding the relative paths the app reads and writes
+    (static/template.png, static/fonts, static/layouts, static/posters, uploads,
+    the database),
+    so a run never touches the repository's own files.
+    """
+    workdir = tempfile.mkdtemp(prefix='bench-')
+    os.makedirs(os.path.join(workdir, 'static', 'posters'))
+    os.makedirs(os.path.join(workdir, 'uploads'))
+    shutil.copy(os.path.join(ROOT, 'static', 'template.png'), os.path.join(workdir, 'static', 'template.png'))
+    os.symlink(os.path.join(ROOT, 'static', 'fonts'), os.path.join(workdir, 'static', 'fonts'))
+    os.symlink(os.path.join(ROOT, 'static', 'layouts'), os.path.join(workdir, 'static', 'layouts'))
+    return workdir
+
+
+def run(args):
+    workdir = make_workspace()
+    cwd = os.getcwd()
+    os.chdir(workdir)
+    # Silence the app's debug prints so they do not skew timings
+    stdout = sys.stdout
+    sys.stdout = open(os.devnull, 'w')
+    try:
+        install_stub(latency=args.latency / 1000)
+        results = {
+            'meta': {
+                'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                'git': git_revision(),
+                'python': platform.python_version(),
+                'platform': platform.platform(),
+            },
+        }
+        results['startup'] = bench_startup(args.startup_runs)
+        results['parse'] = bench_parse(args.iterations)
+        results['rss_after_parse_mb'] = peak_rss_mb()
+        results['scraper_route'] = bench_scraper_route(max(1, args.iterations // 2), args.latency / 1000)
+        results['rss_after_scraper_mb'] = peak_rss_mb()
+        results['sentiment'] = bench_sentiment(args.sentiment_rounds)
+        results['rss_after_sentiment_mb'] = peak_rss_mb()
+        results['posters'] = bench_posters(args.posters)
+        results['peak_rss_mb'] = peak_rss_mb()
+    finally:
+        sys.stdout.close()
+        sys.stdout = stdout
+        os.chdir(cwd)
+        shutil.rmtree(workdir, ignore_errors=True)
+    return results
+
+
+def flatten(data, prefix=''):
+    flat = {}
+    for key, value in data.items():
+        name = f'{prefix}{key}'
+        if isinstance(value, dict):
+            flat.update(flatten(value, name + '.'))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[name] = value
+    return flat
+
+
+def compare(old_path, new_path):
+    """Print every numeric metric that exists in both runs with its relative change."""
+    with open(old_path) as f:
+        old = flatten(json.load(f))
+    with open(new_path) as f:
+        new = flatten(json.load(f))
+    width = max((len(k) for k in old if k in new), default=10)
+    for key in sorted(old):
+        if key not in new or key.endswith('.n'):
+            continue
+        before, after = old[key], new[key]
+        change = (after - before) / before * 100 if before else 0.0
+        print(f'{key:<{width}}  {before:>12.3f}  {after:>12.3f}  {change:+7.1f}%')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--iterations', type=int, default=20, help='iterations per parse / route measurement')
+    parser.add_argument('--posters', type=int, default=30, help='posters to render')
+    parser.add_argument('--sentiment-rounds', type=int, default=25, help='batches of 20 mock reviews to score')
+    parser.add_argument('--startup-runs', type=int, default=5, help='fresh interpreters started per startup mode')
+    parser.add_argument('--latency', type=float, default=0.0, help='simulated network latency per request, in ms')
+    parser.add_argument('--quick', action='store_true', help='small iteration counts for a smoke run')
+    parser.add_argument('--output', help='where to write the JSON results')
+    parser.add_argument('--compare', nargs=2, metavar=('OLD', 'NEW'), help='compare two result files and exit')
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        return
+    if args.quick:
+        args.iterations, args.posters, args.sentiment_rounds, args.startup_runs = 3, 5, 3, 2
+
+    results = run(args)
+    output = args.output or os.path.join(ROOT, 'benchmarks', 'results', f"bench-{time.strftime('%Y%m%d-%H%M%S')}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(json.dumps(results, indent=2))
+    print(f'Results written to {output}')
+
+
+if __name__ == '__main__':
+    main()
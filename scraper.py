@@ -1,36 +1,44 @@
-import requests
-from bs4 import BeautifulSoup
-from bs4.element import Tag
-import traceback
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+from utils import http_client, page_cache, extract, metrics, store
 
+log = logging.getLogger(__name__)
 
-def scrape_indiamart(url):
+PAGES = metrics.counter('scraper_pages', 'Search pages scraped, by outcome (ok, empty, blocked, error).', ('platform', 'outcome'))
+PRODUCTS_FOUND = metrics.histogram('scraper_products_found', 'Products extracted per search page.', ('platform',),
+                                   buckets=metrics.COUNT_BUCKETS)
+# Parsing stops at the product limit, so this counts the cards read to fill it, not every card on the page
+CARDS_SCANNED = metrics.histogram('scraper_cards_scanned', 'Product cards scanned per search page.', ('platform',),
+                                  buckets=metrics.COUNT_BUCKETS)
+
+# Crawl mode: result pages fetched at once per host (shared by all crawls), page and product caps,
+# and the products read from one page (no 10-card cap)
+CRAWL_PER_HOST = 4
+CRAWL_MAX_PAGES = 25
+CRAWL_MAX_PRODUCTS = 500
+CRAWL_PAGE_LIMIT = 100
+PAGE_PARAM = 'page'
+FLIPKART_BLOCKED = "Blocked by Flipkart anti-bot. Try again later or use browser cookies."
+FLIPKART_EMPTY = "No products found. Flipkart may have changed their layout or blocked the request."
+
+_crawl_slots = {}
+_crawl_slots_lock = threading.Lock()
+
+
+def scrape_indiamart(url, limit=extract.MAX_PRODUCTS):
     """
     Scrape product info from an IndiaMART search results page.
-    Returns a list of dicts: {name, price, description, platform}
+    Returns a list of up to `limit` dicts: {name, price, description, platform}
     """
-    headers = {
-        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/58.0.3029.110 Safari/537.3'}
-    resp = requests.get(url, headers=headers)
-    soup = BeautifulSoup(resp.text, 'html.parser')
-    products = []
-    for card in soup.select('div.card'):
-        name_tag = card.select_one('div.producttitle a.cardlinks')
-        price_tag = card.select_one('p.price, p.getquote')
-        desc_tag = card.select_one('div.producttitle a.cardlinks')
-        name = name_tag.get_text(strip=True) if name_tag else 'N/A'
-        price = price_tag.get_text(strip=True) if price_tag else 'N/A'
-        description = desc_tag.get_text(strip=True) if desc_tag else 'N/A'
-        products.append({
-            'name': name,
-            'price': price,
-            'description': description,
-            'platform': 'IndiaMART'
-        })
-        if len(products) >= 10:
-            break
+    resp = page_cache.get(url)
+    products, cards = extract.parse_indiamart(resp.text, limit)
+    CARDS_SCANNED.observe(cards, platform='indiamart')
+    PRODUCTS_FOUND.observe(len(products), platform='indiamart')
+    PAGES.inc(platform='indiamart', outcome='ok' if products else 'empty')
     if not products:
-        print('[DEBUG] IndiaMART: No products found. Check selectors or anti-bot.')
+        log.debug('IndiaMART: no products found, check selectors or anti-bot', extra={'url': url})
     return products
 
 
@@ -45,90 +53,143 @@ def parse_cookies(cookie_str):
     return cookies
 
 
-def scrape_flipkart(url, cookie_str=None, max_retries=3):
+def scrape_flipkart(url, cookie_str=None, max_retries=3, limit=extract.MAX_PRODUCTS):
     """
     Scrape product info from a Flipkart search results page.
-    Returns a dict: {'products': [...], 'error': ...}
+    Returns a dict: {'products': [...up to `limit`], 'error': ...}
     Each product includes 'product_url' for review extraction.
     """
-    import time
-    headers = {
-        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/58.0.3029.110 Safari/537.3'}
     cookies = parse_cookies(cookie_str) if cookie_str else None
     last_error = None
     for attempt in range(max_retries):
         try:
-            resp = requests.get(url, headers=headers, cookies=cookies, timeout=10)
-            soup = BeautifulSoup(resp.text, 'html.parser')
-            print("[DEBUG] Flipkart title:", soup.title)
-            print("[DEBUG] Flipkart status code:", resp.status_code)
+            resp = page_cache.get(url, cookies=cookies)
+            log.debug('Flipkart response', extra={'status': resp.status_code, 'from_cache': resp.from_cache})
             # Detect anti-bot/"rush" page
-            if soup.find(string=lambda s: isinstance(s, str) and ("Lot of rush" in s or "Retry in" in s)):
-                last_error = "Blocked by Flipkart anti-bot. Try again later or use browser cookies."
-                time.sleep(2 ** attempt)  # Exponential backoff
+            if extract.is_flipkart_blocked(resp.text):
+                PAGES.inc(platform='flipkart', outcome='blocked')
+                last_error = FLIPKART_BLOCKED
+                page_cache.invalidate(url)
+                http_client.backoff(attempt)
                 continue
-            products = []
-            cards = soup.select('a.CGtC98')
+            products, cards = extract.parse_flipkart(resp.text, limit)
+            CARDS_SCANNED.observe(cards, platform='flipkart')
+            PRODUCTS_FOUND.observe(len(products), platform='flipkart')
             if not cards:
-                print('[WARNING] Flipkart: No product cards found with selector a.CGtC98. HTML snippet:', resp.text[:500])
-            for card in cards:
-                try:
-                    name = card.find('div', class_='KzDlHZ')
-                    price = card.find('div', class_='Nx9bqj _4b5DiR')
-                    if not price:
-                        price = card.find('div', class_='_30jeq3')
-                    desc_ul = card.find('ul', class_='G4BRas')
-                    description = None
-                    if desc_ul and isinstance(desc_ul, Tag):
-                        description = ' | '.join(li.get_text(strip=True) for li in desc_ul.find_all('li'))
-                    href = card.get('href')
-                    product_url = f'https://www.flipkart.com{href}' if isinstance(href, str) and href.startswith('/') else href
-                    products.append({
-                        'name': name.get_text(strip=True) if name else 'N/A',
-                        'price': price.get_text(strip=True) if price else 'N/A',
-                        'description': description if description else 'N/A',
-                        'platform': 'Flipkart',
-                        'product_url': product_url
-                    })
-                    if len(products) >= 10:
-                        break
-                except Exception as parse_e:
-                    print(f"[ERROR] Flipkart product parsing failed: {parse_e}")
-                    traceback.print_exc()
+                log.warning('Flipkart: no product cards found with selector a.CGtC98', extra={'snippet': resp.text[:500]})
             if products:
+                PAGES.inc(platform='flipkart', outcome='ok')
                 return {'products': products, 'error': None}
-            print('[DEBUG] Flipkart: No products found. HTML snippet:', resp.text[:500])
-            last_error = "No products found. Flipkart may have changed their layout or blocked the request."
+            PAGES.inc(platform='flipkart', outcome='empty')
+            log.debug('Flipkart: no products found', extra={'snippet': resp.text[:500]})
+            page_cache.invalidate(url)
+            last_error = FLIPKART_EMPTY
         except Exception as e:
-            print(f"[ERROR] Flipkart scraping failed: {e}")
-            traceback.print_exc()
+            PAGES.inc(platform='flipkart', outcome='error')
+            log.exception('Flipkart scraping failed')
             last_error = str(e)
-            time.sleep(2 ** attempt)
+            # Transport errors were already retried by the client
+            break
     return {'products': [], 'error': last_error}
 
 
-def scrape_amazon(url):
-    headers = {
-        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/58.0.3029.110 Safari/537.3'}
-    resp = requests.get(url, headers=headers)
-    soup = BeautifulSoup(resp.text, 'html.parser')
-    products = []
-    for card in soup.select('div.s-result-item'):
-        name = card.select_one('span.a-size-medium.a-color-base.a-text-normal')
-        price = card.select_one('span.a-price-whole')
-        desc = card.select_one('div.a-row.a-size-base.a-color-secondary, div.a-row.a-size-base.a-color-base')
-        link = card.select_one('a.a-link-normal.a-text-normal, a.a-link-normal.s-underline-text.s-underline-link-text.s-link-style.a-text-normal')
-        href = link.get('href') if link else None
-        product_url = f'https://www.amazon.in{href}' if isinstance(href, str) and href.startswith('/') else href
-        if not name:
-            continue
-        products.append({
-            'name': name.get_text(strip=True),
-            'price': price.get_text(strip=True) if price else 'N/A',
-            'description': desc.get_text(" ", strip=True) if desc else 'N/A',
-            'platform': 'Amazon',
-            'product_url': product_url
-        })
-        if len(products) >= 10:
-            break
-    return products 
\ No newline at end of file
+def scrape_amazon(url, limit=extract.MAX_PRODUCTS):
+    resp = page_cache.get(url)
+    products, cards = extract.parse_amazon(resp.text, limit)
+    CARDS_SCANNED.observe(cards, platform='amazon')
+    PRODUCTS_FOUND.observe(len(products), platform='amazon')
+    PAGES.inc(platform='amazon', outcome='ok' if products else 'empty')
+    return products
+
+
+def page_url(url, page):
+    """`url` with its result page number set to `page` (page 1 is the URL as given)."""
+    parts = urlsplit(url)
+    query = [(k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True) if k != PAGE_PARAM]
+    if page > 1:
+        query.append((PAGE_PARAM, str(page)))
+    return urlunsplit(parts._replace(query=urlencode(query)))
+
+
+def _host_slot(url):
+    host = urlsplit(url).netloc.lower()
+    with _crawl_slots_lock:
+        return _crawl_slots.setdefault(host, threading.BoundedSemaphore(CRAWL_PER_HOST))
+
+
+def _crawl_flipkart_page(url, page):
+    """
+    One Flipkart result page, fetched once. Unlike scrape_flipkart an empty page
+    past the first is the end of the results, not a failure to retry.
+    """
+    resp = page_cache.get(url)
+    if extract.is_flipkart_blocked(resp.text):
+        PAGES.inc(platform='flipkart', outcome='blocked')
+        page_cache.invalidate(url)
+        return [], FLIPKART_BLOCKED
+    products, cards = extract.parse_flipkart(resp.text, CRAWL_PAGE_LIMIT)
+    CARDS_SCANNED.observe(cards, platform='flipkart')
+    PRODUCTS_FOUND.observe(len(products), platform='flipkart')
+    PAGES.inc(platform='flipkart', outcome='ok' if products else 'empty')
+    if products or page > 1:
+        return products, None
+    page_cache.invalidate(url)
+    return [], FLIPKART_EMPTY
+
+
+def _scrape_page(platform, url, page):
+    """(products, error) for one result page, holding a crawl slot for its host."""
+    with _host_slot(url):
+        if platform == 'flipkart':
+            return _crawl_flipkart_page(url, page)
+        if platform == 'amazon':
+            return scrape_amazon(url, limit=CRAWL_PAGE_LIMIT), None
+        return scrape_indiamart(url, limit=CRAWL_PAGE_LIMIT), None
+
+
+def crawl_pages(url, max_products=CRAWL_MAX_PRODUCTS, max_pages=CRAWL_MAX_PAGES, concurrency=CRAWL_PER_HOST):
+    """
+    Follow a search's result pages, fetching up to `concurrency` pages at once.
+    Yields (page, products, error) in page order as soon as each page is ready;
+    products already seen on earlier pages are dropped. Stops at the first page
+    with nothing new (the end of the results), on an error, or at `max_products`.
+    """
+    platform = page_cache.platform_of(url)
+    if platform is None:
+        raise ValueError('Only IndiaMART, Flipkart, and Amazon URLs are supported for now.')
+    max_pages = max(1, min(max_pages, CRAWL_MAX_PAGES))
+    seen = set()
+    total = 0
+    executor = ThreadPoolExecutor(max_workers=max(1, min(concurrency, max_pages)))
+    try:
+        futures = {}
+        next_page = 1
+        for page in range(1, max_pages + 1):
+            # Keep the window full: pages ahead of the one being yielded are already in flight
+            while next_page <= max_pages and len(futures) < concurrency:
+                futures[next_page] = executor.submit(_scrape_page, platform, page_url(url, next_page), next_page)
+                next_page += 1
+            try:
+                products, error = futures.pop(page).result()
+            except Exception as e:
+                log.exception('Crawl page failed', extra={'url': url, 'page': page})
+                products, error = [], str(e)
+            fresh = []
+            for p in products:
+                key = store.product_key(p)
+                if key not in seen:
+                    seen.add(key)
+                    fresh.append(p)
+            fresh = fresh[:max_products - total]
+            total += len(fresh)
+            yield page, fresh, error
+            if error or not fresh or total >= max_products:
+                return
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+def crawl(url, max_products=CRAWL_MAX_PRODUCTS, max_pages=CRAWL_MAX_PAGES, concurrency=CRAWL_PER_HOST):
+    """Products across a search's result pages, deduplicated, as a generator."""
+    for _, products, _ in crawl_pages(url, max_products, max_pages, concurrency):
+        yield from products
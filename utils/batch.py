@@ -0,0 +1,171 @@
+"""
+Batch poster generation from CSV/JSON catalogs.
+Rows are rendered in parallel on a process pool whose workers each warm the
+shared render context once; results are written to the posters table in a
+single transaction and can be bundled into a ZIP.
+"""
+import csv
+import io
+import json
+import multiprocessing
+import os
+import time
+import zipfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from utils import layouts
+from utils.poster_maker import generate_poster
+from utils.render_cache import render_key
+from utils.render_context import prepare_layouts
+
+# Render processes start from a forkserver, not by forking the caller: a web process
+# already runs job, cache-refresh and sampler threads, and a child forked from it can
+# deadlock on a lock one of them held. The server preloads this module so starting a
+# worker stays cheap
+_START_METHOD = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+_mp_context = multiprocessing.get_context(_START_METHOD)
+if _START_METHOD == 'forkserver':
+    _mp_context.set_forkserver_preload(['utils.batch'])
+
+COLUMNS = ('product_name', 'price', 'description', 'image', 'layout')
+MAX_ROWS = 5000
+
+
+class CatalogError(ValueError):
+    pass
+
+
+def load_catalog(data, filename=''):
+    """
+    Parse catalog bytes/text into a list of row dicts with the keys in COLUMNS.
+    JSON is either a list of objects or {"products": [...]}; anything else is read as CSV.
+    An empty layout column means the default layout.
+    """
+    if isinstance(data, bytes):
+        data = data.decode('utf-8-sig')
+    text = data.strip()
+    if filename.lower().endswith('.json') or text.startswith(('[', '{')):
+        try:
+            parsed = json.loads(text)
+        except ValueError as e:
+            raise CatalogError(f'Invalid JSON catalog: {e}')
+        if isinstance(parsed, dict):
+            parsed = parsed.get('products', [])
+        if not isinstance(parsed, list):
+            raise CatalogError('JSON catalog must be a list of products.')
+        raw_rows = parsed
+    else:
+        raw_rows = list(csv.DictReader(io.StringIO(text)))
+    rows = []
+    for i, raw in enumerate(raw_rows):
+        if not isinstance(raw, dict):
+            raise CatalogError(f'Row {i + 1} is not an object.')
+        row = {key: str(raw.get(key) or '').strip() for key in COLUMNS}
+        if not row['product_name']:
+            raise CatalogError(f'Row {i + 1} has no product_name.')
+        row['layout'] = row['layout'] or layouts.DEFAULT_LAYOUT
+        try:
+            layouts.load_layout(row['layout'])
+        except layouts.LayoutError as e:
+            raise CatalogError(f'Row {i + 1}: {e}')
+        rows.append(row)
+    if len(rows) > MAX_ROWS:
+        raise CatalogError(f'Catalog has {len(rows)} rows; the limit is {MAX_ROWS}.')
+    return rows
+
+
+def _init_worker():
+    # Compose layout base layers and load fonts once per worker process, not once per poster
+    prepare_layouts()
+
+
+def _render_row(index, row, image_path):
+    poster_filename, caption = generate_poster(row['product_name'], row['price'], row['description'], image_path,
+                                               layout=row['layout'])
+    return index, poster_filename, caption
+
+
+def render_batch(rows, resolve_image, workers=None, cached=None):
+    """
+    Render every row on a process pool and yield one result dict per row as it finishes:
+    {'index', 'row', 'image_filename', 'poster_filename', 'caption', 'render_key', 'cached', 'error'}.
+    `resolve_image(name)` maps a row's image column to a local path (or None).
+    `cached(render_key)` may return an existing posters row, which is yielded without rendering.
+    """
+    jobs = {}
+    for index, row in enumerate(rows):
+        image_path = resolve_image(row['image']) if row['image'] else None
+        result = {
+            'index': index,
+            'row': row,
+            'image_filename': os.path.basename(image_path) if image_path else None,
+            'poster_filename': None,
+            'caption': None,
+            'render_key': render_key(row['product_name'], row['price'], row['description'], image_path, row['layout']),
+            'cached': False,
+            'error': None,
+        }
+        if row['image'] and image_path is None:
+            result['error'] = f"Image not found: {row['image']}"
+            yield result
+            continue
+        if result['render_key'] in jobs:
+            # Identical row earlier in this catalog: render once, share the poster
+            result['cached'] = True
+            jobs[result['render_key']][0].append(result)
+            continue
+        existing = cached(result['render_key']) if cached else None
+        if existing is not None:
+            result.update(poster_filename=existing['poster_filename'], caption=existing['caption'], cached=True)
+            yield result
+        else:
+            jobs[result['render_key']] = ([result], image_path)
+    if not jobs:
+        return
+    workers = workers or os.cpu_count() or 1
+    with ProcessPoolExecutor(max_workers=min(workers, len(jobs)), mp_context=_mp_context, initializer=_init_worker) as pool:
+        futures = {pool.submit(_render_row, group[0]['index'], group[0]['row'], image_path): group
+                   for group, image_path in jobs.values()}
+        for future in as_completed(futures):
+            group = futures[future]
+            try:
+                _, poster_filename, caption = future.result()
+                error = None
+            except Exception as e:
+                poster_filename, caption, error = None, None, f'{type(e).__name__}: {e}'
+            for result in group:
+                result.update(poster_filename=poster_filename, caption=caption, error=error)
+                yield result
+
+
+def save_posters(conn, results):
+    """
+    Insert all newly rendered rows into the posters table in one transaction.
+    Rows served from the render cache already have their row.
+    """
+    now = time.time()
+    records = [(r['row']['product_name'], r['row']['price'], r['row']['description'],
+                r['image_filename'], r['poster_filename'], r['caption'], r['render_key'], r['row']['layout'], now)
+               for r in sorted(results, key=lambda r: r['index']) if not r['error'] and not r['cached']]
+    with conn:
+        conn.executemany('INSERT INTO posters (product_name, price, description, image_filename, poster_filename, caption, render_key, layout, created_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                         records)
+    return len(records)
+
+
+def write_zip(results, poster_folder, zip_path):
+    """Bundle rendered posters plus a manifest.csv of every row into `zip_path`."""
+    os.makedirs(os.path.dirname(zip_path) or '.', exist_ok=True)
+    manifest = io.StringIO()
+    writer = csv.writer(manifest)
+    writer.writerow(COLUMNS + ('poster_filename', 'caption', 'error'))
+    written = set()
+    with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_STORED) as zf:
+        for r in sorted(results, key=lambda r: r['index']):
+            writer.writerow([r['row'][c] for c in COLUMNS] + [r['poster_filename'] or '', r['caption'] or '', r['error'] or ''])
+            if r['poster_filename'] and r['poster_filename'] not in written:
+                written.add(r['poster_filename'])
+                # PNGs are already compressed, so store them as-is
+                zf.write(os.path.join(poster_folder, r['poster_filename']), r['poster_filename'])
+        zf.writestr('manifest.csv', manifest.getvalue())
+    return zip_path
@@ -0,0 +1,197 @@
+"""
+SQLite access for poster_maker.db.
+Connections run in WAL mode with tuned pragmas and are reused: one per
+thread (and per process, so forked workers never share one). Schema changes
+live in MIGRATIONS and are applied once, tracked by PRAGMA user_version.
+"""
+import logging
+import os
+import sqlite3
+import threading
+
+# Seconds to wait for a write lock before failing with 'database is locked'
+BUSY_TIMEOUT = 30
+PRAGMAS = (
+    'PRAGMA synchronous = NORMAL',   # safe with WAL; fsync at checkpoints only
+    'PRAGMA cache_size = -16000',    # 16 MB page cache per connection
+    'PRAGMA mmap_size = 134217728',  # read through a 128 MB memory map
+    'PRAGMA temp_store = MEMORY',
+)
+
+log = logging.getLogger(__name__)
+
+_local = threading.local()
+_migrated = set()
+_migrate_lock = threading.Lock()
+
+
+def connect(db_path, autocommit=False):
+    """New connection with Row results and the pragmas applied."""
+    conn = sqlite3.connect(db_path, timeout=BUSY_TIMEOUT, isolation_level=None if autocommit else '')
+    conn.row_factory = sqlite3.Row
+    for pragma in PRAGMAS:
+        conn.execute(pragma)
+    return conn
+
+
+def get_connection(db_path, autocommit=False):
+    """This thread's connection to `db_path`, opened on first use and reused afterwards."""
+    conns = getattr(_local, 'conns', None)
+    if conns is None or _local.pid != os.getpid():
+        # Connections must not cross a fork; start over in a new process
+        conns = _local.conns = {}
+        _local.pid = os.getpid()
+    key = (os.path.abspath(db_path), autocommit)
+    conn = conns.get(key)
+    if conn is None:
+        conn = conns[key] = connect(db_path, autocommit)
+    return conn
+
+
+def release(db_path):
+    """End of a request: roll back anything left uncommitted but keep the connection open."""
+    conns = getattr(_local, 'conns', None)
+    if conns and _local.pid == os.getpid():
+        conn = conns.get((os.path.abspath(db_path), False))
+        if conn is not None and conn.in_transaction:
+            conn.rollback()
+
+
+def close_all():
+    """Close this thread's connections."""
+    conns = getattr(_local, 'conns', None) or {}
+    for conn in conns.values():
+        conn.close()
+    conns.clear()
+
+
+def _columns(conn, table):
+    return {row[1] for row in conn.execute(f'PRAGMA table_info({table})')}
+
+
+def _initial_schema(conn):
+    # executescript() would commit the migration transaction, so run statements one by one
+    script = '''
+        CREATE TABLE IF NOT EXISTS posters (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            product_name TEXT,
+            price TEXT,
+            description TEXT,
+            image_filename TEXT,
+            poster_filename TEXT,
+            caption TEXT
+        );
+        CREATE TABLE IF NOT EXISTS products (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            platform TEXT NOT NULL,
+            product_url TEXT NOT NULL,
+            name TEXT,
+            description TEXT,
+            price TEXT,
+            sentiment TEXT,
+            reviews_fetched_at REAL,
+            first_seen REAL,
+            last_seen REAL,
+            UNIQUE (platform, product_url)
+        );
+        CREATE TABLE IF NOT EXISTS price_observations (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            product_id INTEGER NOT NULL REFERENCES products (id),
+            price TEXT,
+            price_value REAL,
+            observed_at REAL
+        );
+        CREATE INDEX IF NOT EXISTS idx_price_observations_product ON price_observations (product_id, observed_at);
+        CREATE TABLE IF NOT EXISTS reviews (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            product_id INTEGER NOT NULL REFERENCES products (id),
+            content_hash TEXT NOT NULL,
+            text TEXT,
+            polarity REAL,
+            first_seen REAL,
+            UNIQUE (product_id, content_hash)
+        );
+        CREATE TABLE IF NOT EXISTS searches (
+            url_key TEXT PRIMARY KEY,
+            product_ids TEXT,
+            message TEXT,
+            scraped_at REAL
+        );
+        CREATE TABLE IF NOT EXISTS jobs (
+            id TEXT PRIMARY KEY,
+            type TEXT NOT NULL,
+            dedupe_key TEXT NOT NULL,
+            payload TEXT,
+            status TEXT NOT NULL,
+            result TEXT,
+            error TEXT,
+            created_at REAL,
+            started_at REAL,
+            finished_at REAL,
+            worker TEXT
+        );
+        CREATE INDEX IF NOT EXISTS idx_jobs_status_type ON jobs (status, type, created_at);
+        CREATE INDEX IF NOT EXISTS idx_jobs_dedupe ON jobs (dedupe_key, status);
+    '''
+    for statement in script.split(';'):
+        if statement.strip():
+            conn.execute(statement)
+
+
+def _poster_render_key(conn):
+    # Databases created before migrations were tracked may already have the column
+    if 'render_key' not in _columns(conn, 'posters'):
+        conn.execute('ALTER TABLE posters ADD COLUMN render_key TEXT')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_posters_render_key ON posters (render_key)')
+
+
+def _poster_history(conn):
+    if 'created_at' not in _columns(conn, 'posters'):
+        conn.execute('ALTER TABLE posters ADD COLUMN created_at REAL')
+    # History is paged by id (the rowid, already ordered); filtering by product needs its own index
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_posters_product ON posters (product_name, id)')
+
+
+def _poster_layout(conn):
+    if 'layout' not in _columns(conn, 'posters'):
+        conn.execute('ALTER TABLE posters ADD COLUMN layout TEXT')
+
+
+def _job_heartbeat(conn):
+    if 'heartbeat_at' not in _columns(conn, 'jobs'):
+        conn.execute('ALTER TABLE jobs ADD COLUMN heartbeat_at REAL')
+
+
+# Applied in order; a database at user_version N has run the first N
+MIGRATIONS = (
+    _initial_schema,
+    _poster_render_key,
+    _poster_history,
+    _poster_layout,
+    _job_heartbeat,
+)
+
+
+def migrate(db_path):
+    """Bring the schema up to date, once per process, safely across concurrent workers."""
+    key = os.path.abspath(db_path)
+    with _migrate_lock:
+        if key in _migrated:
+            return
+        conn = connect(db_path, autocommit=True)
+        try:
+            conn.execute('PRAGMA journal_mode = WAL')
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                version = conn.execute('PRAGMA user_version').fetchone()[0]
+                for number, step in enumerate(MIGRATIONS[version:], start=version + 1):
+                    step(conn)
+                    conn.execute(f'PRAGMA user_version = {number}')
+                    log.info('Applied migration', extra={'version': number, 'migration': step.__name__.strip('_')})
+                conn.execute('COMMIT')
+            except Exception:
+                conn.execute('ROLLBACK')
+                raise
+        finally:
+            conn.close()
+        _migrated.add(key)
@@ -0,0 +1,344 @@
+"""
+HTML extraction backends for the scrapers.
+The default 'lxml' backend streams the page through lxml's pull parser with
+precompiled XPath selectors and stops as soon as enough cards are complete.
+The 'bs4' backend is the original BeautifulSoup code and is used as a
+fallback when lxml is missing or fails on a page. Both return identical dicts
+and count the cards scanned up to the product limit, not every card on the page.
+"""
+import logging
+import os
+
+from bs4 import BeautifulSoup
+from bs4.element import Tag
+
+from utils import metrics
+
+try:
+    from lxml import etree
+except ImportError:
+    etree = None
+
+BACKEND = os.environ.get('SCRAPER_PARSER', 'lxml' if etree is not None else 'bs4')
+MAX_PRODUCTS = 10
+# Bytes fed to the pull parser at a time; smaller means an earlier stop
+CHUNK_SIZE = 32 * 1024
+BLOCK_MARKERS = ('Lot of rush', 'Retry in')
+# Elements whose content BeautifulSoup's get_text() leaves out
+NON_TEXT_TAGS = ('script', 'style', 'template')
+REVIEW_SELECTORS = {
+    'flipkart': 'div.t-ZTKy',
+    'amazon': 'span[data-hook="review-body"]',
+}
+
+log = logging.getLogger(__name__)
+
+PARSE_SECONDS = metrics.histogram('scraper_parse_seconds', 'HTML extraction time.', ('platform', 'page', 'backend'))
+
+
+# --- BeautifulSoup backend ---
+
+def _bs4_indiamart(html, limit):
+    soup = BeautifulSoup(html, 'html.parser')
+    products = []
+    cards = 0
+    for card in soup.select('div.card'):
+        cards += 1
+        name_tag = card.select_one('div.producttitle a.cardlinks')
+        price_tag = card.select_one('p.price, p.getquote')
+        desc_tag = card.select_one('div.producttitle a.cardlinks')
+        name = name_tag.get_text(strip=True) if name_tag else 'N/A'
+        price = price_tag.get_text(strip=True) if price_tag else 'N/A'
+        description = desc_tag.get_text(strip=True) if desc_tag else 'N/A'
+        products.append({
+            'name': name,
+            'price': price,
+            'description': description,
+            'platform': 'IndiaMART'
+        })
+        if len(products) >= limit:
+            break
+    return products, cards
+
+
+def _bs4_flipkart(html, limit):
+    soup = BeautifulSoup(html, 'html.parser')
+    products = []
+    cards = 0
+    for card in soup.select('a.CGtC98'):
+        cards += 1
+        try:
+            name = card.find('div', class_='KzDlHZ')
+            price = card.find('div', class_='Nx9bqj _4b5DiR')
+            if not price:
+                price = card.find('div', class_='_30jeq3')
+            desc_ul = card.find('ul', class_='G4BRas')
+            description = None
+            if desc_ul and isinstance(desc_ul, Tag):
+                description = ' | '.join(li.get_text(strip=True) for li in desc_ul.find_all('li'))
+            href = card.get('href')
+            product_url = f'https://www.flipkart.com{href}' if isinstance(href, str) and href.startswith('/') else href
+            products.append({
+                'name': name.get_text(strip=True) if name else 'N/A',
+                'price': price.get_text(strip=True) if price else 'N/A',
+                'description': description if description else 'N/A',
+                'platform': 'Flipkart',
+                'product_url': product_url
+            })
+            if len(products) >= limit:
+                break
+        except Exception:
+            log.exception('Flipkart product parsing failed')
+    return products, cards
+
+
+def _bs4_amazon(html, limit):
+    soup = BeautifulSoup(html, 'html.parser')
+    products = []
+    cards = 0
+    for card in soup.select('div.s-result-item'):
+        cards += 1
+        name = card.select_one('span.a-size-medium.a-color-base.a-text-normal')
+        price = card.select_one('span.a-price-whole')
+        desc = card.select_one('div.a-row.a-size-base.a-color-secondary, div.a-row.a-size-base.a-color-base')
+        link = card.select_one('a.a-link-normal.a-text-normal, a.a-link-normal.s-underline-text.s-underline-link-text.s-link-style.a-text-normal')
+        href = link.get('href') if link else None
+        product_url = f'https://www.amazon.in{href}' if isinstance(href, str) and href.startswith('/') else href
+        if not name:
+            continue
+        products.append({
+            'name': name.get_text(strip=True),
+            'price': price.get_text(strip=True) if price else 'N/A',
+            'description': desc.get_text(" ", strip=True) if desc else 'N/A',
+            'platform': 'Amazon',
+            'product_url': product_url
+        })
+        if len(products) >= limit:
+            break
+    return products, cards
+
+
+def _bs4_reviews(html, platform):
+    soup = BeautifulSoup(html, 'html.parser')
+    return [tag.get_text(strip=True) for tag in soup.select(REVIEW_SELECTORS[platform])]
+
+
+def _bs4_blocked(html):
+    soup = BeautifulSoup(html, 'html.parser')
+    return soup.find(string=lambda s: isinstance(s, str) and any(m in s for m in BLOCK_MARKERS)) is not None
+
+
+# --- lxml backend ---
+
+def _has_class(*classes):
+    """XPath predicate matching elements whose class attribute has every token."""
+    return ' and '.join(f"contains(concat(' ', normalize-space(@class), ' '), ' {c} ')" for c in classes)
+
+
+if etree is not None:
+    _XP = {
+        'im_name': etree.XPath(f".//div[{_has_class('producttitle')}]//a[{_has_class('cardlinks')}]"),
+        'im_price': etree.XPath(f".//p[{_has_class('price')} or {_has_class('getquote')}]"),
+        'fk_name': etree.XPath(f".//div[{_has_class('KzDlHZ')}]"),
+        'fk_price': etree.XPath(".//div[@class='Nx9bqj _4b5DiR']"),
+        'fk_price_old': etree.XPath(f".//div[{_has_class('_30jeq3')}]"),
+        'fk_desc': etree.XPath(f".//ul[{_has_class('G4BRas')}]"),
+        'fk_desc_items': etree.XPath('.//li'),
+        'az_name': etree.XPath(f".//span[{_has_class('a-size-medium', 'a-color-base', 'a-text-normal')}]"),
+        'az_price': etree.XPath(f".//span[{_has_class('a-price-whole')}]"),
+        'az_desc': etree.XPath(f".//div[({_has_class('a-row', 'a-size-base', 'a-color-secondary')}) or ({_has_class('a-row', 'a-size-base', 'a-color-base')})]"),
+        'az_link': etree.XPath(f".//a[({_has_class('a-link-normal', 'a-text-normal')}) or ({_has_class('a-link-normal', 's-underline-text', 's-underline-link-text', 's-link-style', 'a-text-normal')})]"),
+        'flipkart_reviews': etree.XPath(f"//div[{_has_class('t-ZTKy')}]"),
+        'amazon_reviews': etree.XPath("//span[@data-hook='review-body']"),
+        'blocked': etree.XPath('//text()[' + ' or '.join(f'contains(., "{m}")' for m in BLOCK_MARKERS) + ']'),
+    }
+
+
+def _classes(el):
+    return (el.get('class') or '').split()
+
+
+def _first(xpath, el):
+    found = xpath(el)
+    return found[0] if found else None
+
+
+def _text(el, sep=''):
+    """Equivalent of BeautifulSoup's get_text(sep, strip=True)."""
+    return sep.join(p for p in (t.strip() for t in _texts(el)) if p)
+
+
+def _texts(el):
+    """Yield text nodes in document order, skipping comments, scripts and styles."""
+    if isinstance(el.tag, str) and el.tag not in NON_TEXT_TAGS and el.text:
+        yield el.text
+    for child in el:
+        if isinstance(child.tag, str):
+            yield from _texts(child)
+        if child.tail:
+            yield child.tail
+
+
+def _stream(html, is_card, extract, limit):
+    """
+    Feed `html` to a pull parser and call `extract` on every complete card element.
+    Parsing stops once `limit` products have been collected.
+    Returns (products, cards seen).
+    """
+    parser = etree.HTMLPullParser(events=('end',))
+    products = []
+    cards = 0
+
+    def collect():
+        nonlocal cards
+        for _, el in parser.read_events():
+            if not is_card(el):
+                continue
+            cards += 1
+            product = extract(el)
+            if product is not None:
+                products.append(product)
+                if len(products) >= limit:
+                    return True
+        return False
+
+    for start in range(0, len(html), CHUNK_SIZE):
+        parser.feed(html[start:start + CHUNK_SIZE])
+        if collect():
+            return products, cards
+    parser.close()
+    collect()
+    return products, cards
+
+
+def _lxml_indiamart(html, limit):
+    def extract(card):
+        name_tag = _first(_XP['im_name'], card)
+        price_tag = _first(_XP['im_price'], card)
+        name = _text(name_tag) if name_tag is not None else 'N/A'
+        return {
+            'name': name,
+            'price': _text(price_tag) if price_tag is not None else 'N/A',
+            'description': name,
+            'platform': 'IndiaMART'
+        }
+
+    def is_card(el):
+        return el.tag == 'div' and 'card' in _classes(el)
+
+    return _stream(html, is_card, extract, limit)
+
+
+def _lxml_flipkart(html, limit):
+    def extract(card):
+        name = _first(_XP['fk_name'], card)
+        price = _first(_XP['fk_price'], card)
+        if price is None:
+            price = _first(_XP['fk_price_old'], card)
+        desc_ul = _first(_XP['fk_desc'], card)
+        description = None
+        if desc_ul is not None:
+            description = ' | '.join(_text(li) for li in _XP['fk_desc_items'](desc_ul))
+        href = card.get('href')
+        product_url = f'https://www.flipkart.com{href}' if isinstance(href, str) and href.startswith('/') else href
+        return {
+            'name': _text(name) if name is not None else 'N/A',
+            'price': _text(price) if price is not None else 'N/A',
+            'description': description if description else 'N/A',
+            'platform': 'Flipkart',
+            'product_url': product_url
+        }
+
+    def is_card(el):
+        return el.tag == 'a' and 'CGtC98' in _classes(el)
+
+    return _stream(html, is_card, extract, limit)
+
+
+def _lxml_amazon(html, limit):
+    def extract(card):
+        name = _first(_XP['az_name'], card)
+        if name is None:
+            return None
+        price = _first(_XP['az_price'], card)
+        desc = _first(_XP['az_desc'], card)
+        link = _first(_XP['az_link'], card)
+        href = link.get('href') if link is not None else None
+        product_url = f'https://www.amazon.in{href}' if isinstance(href, str) and href.startswith('/') else href
+        return {
+            'name': _text(name),
+            'price': _text(price) if price is not None else 'N/A',
+            'description': _text(desc, ' ') if desc is not None else 'N/A',
+            'platform': 'Amazon',
+            'product_url': product_url
+        }
+
+    def is_card(el):
+        return el.tag == 'div' and 's-result-item' in _classes(el)
+
+    return _stream(html, is_card, extract, limit)
+
+
+def _lxml_reviews(html, platform):
+    if not html.strip():
+        return []
+    tree = etree.fromstring(html, etree.HTMLParser())
+    if tree is None:
+        return []
+    return [_text(el) for el in _XP[f'{platform}_reviews'](tree)]
+
+
+def _lxml_blocked(html):
+    # Cheap substring test first; only confirm against text nodes when it hits
+    if not any(m in html for m in BLOCK_MARKERS):
+        return False
+    tree = etree.fromstring(html, etree.HTMLParser())
+    return tree is not None and bool(_XP['blocked'](tree))
+
+
+# --- Public API ---
+
+def _dispatch(lxml_fn, bs4_fn, *args, backend=None, platform=None, page=None):
+    backend = backend or BACKEND
+    if backend == 'lxml' and etree is not None:
+        try:
+            with PARSE_SECONDS.time(platform=platform, page=page, backend='lxml'):
+                return lxml_fn(*args)
+        except Exception as e:
+            log.error('lxml extraction failed, falling back to BeautifulSoup', extra={'error': str(e), 'platform': platform})
+    with PARSE_SECONDS.time(platform=platform, page=page, backend='bs4'):
+        return bs4_fn(*args)
+
+
+def parse_indiamart(html, limit=MAX_PRODUCTS, backend=None):
+    """
+    Products from an IndiaMART search page and the cards scanned for them:
+    ([{name, price, description, platform}], cards).
+    """
+    return _dispatch(_lxml_indiamart, _bs4_indiamart, html, limit, backend=backend, platform='indiamart', page='search')
+
+
+def parse_flipkart(html, limit=MAX_PRODUCTS, backend=None):
+    """Products from a Flipkart search page and the cards scanned for them: (products, cards)."""
+    return _dispatch(_lxml_flipkart, _bs4_flipkart, html, limit, backend=backend, platform='flipkart', page='search')
+
+
+def parse_amazon(html, limit=MAX_PRODUCTS, backend=None):
+    """
+    Products from an Amazon search page and the cards scanned for them:
+    ([{name, price, description, platform, product_url}], cards).
+    """
+    return _dispatch(_lxml_amazon, _bs4_amazon, html, limit, backend=backend, platform='amazon', page='search')
+
+
+def is_flipkart_blocked(html, backend=None):
+    """True when the page is Flipkart's anti-bot "Lot of rush" interstitial."""
+    return _dispatch(_lxml_blocked, _bs4_blocked, html, backend=backend, platform='flipkart', page='block_check')
+
+
+def parse_reviews(html, platform, backend=None):
+    """Review texts from a Flipkart or Amazon product page."""
+    platform = (platform or '').lower()
+    if platform not in REVIEW_SELECTORS:
+        return []
+    return _dispatch(_lxml_reviews, _bs4_reviews, html, platform, backend=backend, platform=platform, page='reviews')
@@ -0,0 +1,167 @@
+"""
+Shared HTTP client for the scrapers and review extraction.
+One pooled keep-alive session for the whole process, uniform timeouts,
+retry with exponential backoff, a per-host politeness delay and per-host
+counters, exported as metrics and in GET /cache/stats.
+"""
+import threading
+import time
+from urllib.parse import urlparse
+
+from utils import metrics
+
+try:  # urllib3 only decodes brotli when one of these is installed
+    import brotli  # noqa: F401
+    _ACCEPT_ENCODING = 'gzip, deflate, br'
+except ImportError:
+    try:
+        import brotlicffi  # noqa: F401
+        _ACCEPT_ENCODING = 'gzip, deflate, br'
+    except ImportError:
+        _ACCEPT_ENCODING = 'gzip, deflate'
+
+USER_AGENT = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/58.0.3029.110 Safari/537.3'
+DEFAULT_HEADERS = {
+    'User-Agent': USER_AGENT,
+    'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8',
+    'Accept-Encoding': _ACCEPT_ENCODING,
+    'Accept-Language': 'en-IN,en;q=0.9',
+    'Connection': 'keep-alive',
+}
+# (connect, read) timeout in seconds
+DEFAULT_TIMEOUT = (5, 10)
+MAX_RETRIES = 3
+BACKOFF_BASE = 1.0
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+# Connection pools are kept per host; this caps sockets per host pool
+POOL_CONNECTIONS = 16
+POOL_MAXSIZE = 8
+# Minimum seconds between two requests to the same host
+HOST_MIN_INTERVAL = 0.2
+HOST_INTERVALS = {}
+
+_session = None
+_session_lock = threading.Lock()
+_host_slots = {}
+_host_lock = threading.Lock()
+_stats = {}
+_stats_lock = threading.Lock()
+
+REQUESTS = metrics.counter('http_client_requests', 'Outgoing requests, by host and outcome (ok, error).', ('host', 'outcome'))
+RESPONSE_BYTES = metrics.counter('http_client_response_bytes', 'Decoded response body bytes, by host.', ('host',))
+RETRIES = metrics.counter('http_client_retries', 'Requests retried after an error or a 429/5xx response, by host.', ('host',))
+REQUEST_SECONDS = metrics.histogram('http_client_request_seconds', 'Outgoing request latency, by host.', ('host',))
+
+
+def get_session():
+    """Return the process-wide pooled session, creating it on first use."""
+    global _session
+    if _session is None:
+        # requests is imported on first use, keeping it out of app start-up
+        import requests
+        from requests.adapters import HTTPAdapter
+        with _session_lock:
+            if _session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=POOL_CONNECTIONS, pool_maxsize=POOL_MAXSIZE)
+                session.mount('http://', adapter)
+                session.mount('https://', adapter)
+                session.headers.update(DEFAULT_HEADERS)
+                _session = session
+    return _session
+
+
+def backoff(attempt, base=BACKOFF_BASE):
+    """Sleep for an exponentially growing delay: base * 2**attempt seconds."""
+    time.sleep(base * (2 ** attempt))
+
+
+def _host(url):
+    return urlparse(url).netloc.lower()
+
+
+def _wait_for_host(host):
+    """Reserve the next request slot for `host` and sleep until it is due."""
+    interval = HOST_INTERVALS.get(host, HOST_MIN_INTERVAL)
+    if interval <= 0:
+        return
+    with _host_lock:
+        now = time.monotonic()
+        slot = max(now, _host_slots.get(host, 0.0))
+        _host_slots[host] = slot + interval
+    if slot > now:
+        time.sleep(slot - now)
+
+
+def _record(host, **deltas):
+    with _stats_lock:
+        entry = _stats.setdefault(host, {'requests': 0, 'bytes': 0, 'retries': 0, 'errors': 0, 'latency_total': 0.0, 'latency_max': 0.0})
+        for key, value in deltas.items():
+            if key == 'latency':
+                entry['latency_total'] += value
+                entry['latency_max'] = max(entry['latency_max'], value)
+            else:
+                entry[key] += value
+    if 'requests' in deltas:
+        REQUESTS.inc(deltas['requests'], host=host, outcome='error' if deltas.get('errors') else 'ok')
+    if deltas.get('bytes'):
+        RESPONSE_BYTES.inc(deltas['bytes'], host=host)
+    if 'retries' in deltas:
+        RETRIES.inc(deltas['retries'], host=host)
+    if 'latency' in deltas:
+        REQUEST_SECONDS.observe(deltas['latency'], host=host)
+
+
+def _retry_after(resp):
+    value = resp.headers.get('Retry-After')
+    if value and value.isdigit():
+        return min(int(value), 30)
+    return None
+
+
+def get(url, headers=None, cookies=None, timeout=DEFAULT_TIMEOUT, max_retries=MAX_RETRIES, backoff_base=BACKOFF_BASE):
+    """
+    GET `url` through the shared session.
+    Connection errors, timeouts and 429/5xx responses are retried with exponential
+    backoff, for up to `max_retries` attempts in all (always at least one). Returns the
+    final response, or raises the last exception if the final attempt failed without one.
+    """
+    import requests
+    session = get_session()
+    host = _host(url)
+    attempts = max(1, max_retries)
+    last_exc = None
+    for attempt in range(attempts):
+        if attempt:
+            _record(host, retries=1)
+        _wait_for_host(host)
+        start = time.perf_counter()
+        try:
+            resp = session.get(url, headers=headers, cookies=cookies, timeout=timeout)
+        except (requests.ConnectionError, requests.Timeout) as e:
+            _record(host, requests=1, errors=1, latency=time.perf_counter() - start)
+            last_exc = e
+            if attempt + 1 < attempts:
+                backoff(attempt, backoff_base)
+            continue
+        _record(host, requests=1, bytes=len(resp.content), latency=time.perf_counter() - start)
+        if resp.status_code in RETRY_STATUSES and attempt + 1 < attempts:
+            delay = _retry_after(resp)
+            if delay is not None:
+                time.sleep(delay)
+            else:
+                backoff(attempt, backoff_base)
+            continue
+        return resp
+    raise last_exc
+
+
+def stats():
+    """Snapshot of per-host counters: requests, decoded body bytes, retries, errors and latency."""
+    with _stats_lock:
+        snapshot = {}
+        for host, entry in _stats.items():
+            entry = dict(entry)
+            entry['latency_avg'] = entry['latency_total'] / entry['requests'] if entry['requests'] else 0.0
+            snapshot[host] = entry
+        return snapshot
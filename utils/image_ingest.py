@@ -0,0 +1,143 @@
+"""
+Product image ingestion for posters.
+Uploads are validated from their header before any pixel data is decoded,
+JPEGs are decoded at a reduced scale (draft mode) and everything is
+downscaled to fit the poster slot with its aspect ratio kept. The normalised
+image is cached in memory and on disk, keyed by the upload's content hash,
+so re-renders of the same upload decode nothing.
+"""
+import os
+import threading
+from collections import OrderedDict
+
+from PIL import Image
+
+from utils.render_cache import MAX_IMAGE_BYTES, file_digest
+
+MAX_IMAGE_PIXELS = 50 * 1000 * 1000
+NORMALIZED_FOLDER = os.path.join('uploads', 'normalized')
+# Normalised images kept in memory per process
+MAX_MEMORY_IMAGES = 64
+# Modes Pillow can resample directly; others (palette, 16-bit, ...) are converted first
+RESAMPLE_MODES = ('RGB', 'RGBA', 'L', 'LA', 'CMYK')
+
+_memory = OrderedDict()
+_lock = threading.Lock()
+_stats = {'images': 0, 'memory_hits': 0, 'disk_hits': 0, 'bytes_read': 0, 'pixels_decoded': 0}
+
+
+class ImageError(ValueError):
+    pass
+
+
+class _CountingFile:
+    """File wrapper counting the bytes Pillow actually reads."""
+
+    def __init__(self, f):
+        self._f = f
+        self.bytes_read = 0
+
+    def read(self, size=-1):
+        data = self._f.read(size)
+        self.bytes_read += len(data)
+        return data
+
+    def seek(self, offset, whence=0):
+        return self._f.seek(offset, whence)
+
+    def tell(self):
+        return self._f.tell()
+
+
+def validate(path, max_bytes=MAX_IMAGE_BYTES, max_pixels=MAX_IMAGE_PIXELS):
+    """
+    Check file size, format and dimensions from the header only.
+    Returns (width, height); raises ImageError for anything unusable.
+    """
+    size = os.path.getsize(path)
+    if size > max_bytes:
+        raise ImageError(f'Image is {size // (1024 * 1024)} MB; the limit is {max_bytes // (1024 * 1024)} MB.')
+    try:
+        with Image.open(path) as img:
+            width, height = img.size
+    except (OSError, Image.DecompressionBombError) as e:
+        raise ImageError(f'Not a supported image: {e}')
+    if width * height > max_pixels:
+        raise ImageError(f'Image is {width}x{height}; the limit is {max_pixels // 1000000} megapixels.')
+    return width, height
+
+
+def fit_size(size, box):
+    """Largest size with the aspect ratio of `size` that fits inside `box`."""
+    scale = min(box[0] / size[0], box[1] / size[1])
+    return max(1, round(size[0] * scale)), max(1, round(size[1] * scale))
+
+
+def _decode(path, box):
+    """Decode `path` straight to an RGBA image fitting `box`; returns (image, info)."""
+    with open(path, 'rb') as raw:
+        counter = _CountingFile(raw)
+        with Image.open(counter) as img:
+            source = img.size
+            target = fit_size(source, box)
+            if img.format == 'JPEG':
+                # Let libjpeg decode at 1/2, 1/4 or 1/8 scale, never below the target
+                img.draft('RGB', target)
+            decoded = img.size
+            if img.mode not in RESAMPLE_MODES:
+                img = img.convert('RGBA')
+            if target[0] < img.size[0]:
+                img.thumbnail(target, Image.LANCZOS, reducing_gap=2.0)
+            else:
+                img = img.resize(target, Image.LANCZOS)
+            out = img.convert('RGBA')
+    info = {
+        'source_size': source,
+        'bytes_read': counter.bytes_read,
+        'pixels_decoded': decoded[0] * decoded[1],
+        'cache': 'miss',
+    }
+    return out, info
+
+
+def load_product_image(path, box):
+    """
+    Product image at `path` fitted into `box` (w, h) with its aspect ratio kept, as RGBA.
+    Returns (image, info) where info reports the bytes read and pixels decoded.
+    """
+    validate(path)
+    key = f'{file_digest(path)}_{box[0]}x{box[1]}'
+    with _lock:
+        img = _memory.get(key)
+        if img is not None:
+            _memory.move_to_end(key)
+            _stats['images'] += 1
+            _stats['memory_hits'] += 1
+            return img, {'bytes_read': 0, 'pixels_decoded': 0, 'cache': 'memory'}
+    disk_path = os.path.join(NORMALIZED_FOLDER, f'{key}.png')
+    if os.path.exists(disk_path):
+        with Image.open(disk_path) as cached:
+            img = cached.convert('RGBA')
+        info = {'bytes_read': os.path.getsize(disk_path), 'pixels_decoded': img.size[0] * img.size[1], 'cache': 'disk'}
+    else:
+        img, info = _decode(path, box)
+        os.makedirs(NORMALIZED_FOLDER, exist_ok=True)
+        tmp_path = f'{disk_path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        # Favour speed over size: these are small, private cache files
+        img.save(tmp_path, 'PNG', compress_level=1)
+        os.replace(tmp_path, disk_path)
+    with _lock:
+        _memory[key] = img
+        while len(_memory) > MAX_MEMORY_IMAGES:
+            _memory.popitem(last=False)
+        _stats['images'] += 1
+        _stats['bytes_read'] += info['bytes_read']
+        _stats['pixels_decoded'] += info['pixels_decoded']
+        if info['cache'] == 'disk':
+            _stats['disk_hits'] += 1
+    return img, info
+
+
+def stats():
+    with _lock:
+        return dict(_stats, memory_entries=len(_memory))
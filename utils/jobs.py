@@ -0,0 +1,214 @@
+"""
+Persistent background job queue backed by SQLite.
+Routes enqueue work and return a job id; worker processes (or threads) claim
+queued jobs, run the registered handler and store its JSON result.
+Identical in-flight jobs are deduplicated and each job type has its own
+concurrency cap.
+"""
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+from utils import db, metrics
+
+QUEUED, RUNNING, DONE, FAILED = 'queued', 'running', 'done', 'failed'
+ACTIVE = (QUEUED, RUNNING)
+# A running job's worker records a heartbeat this often; a job whose heartbeat is
+# older than STALE_AFTER belongs to a dead worker and is requeued
+HEARTBEAT_INTERVAL = 10
+STALE_AFTER = 60
+# How often each worker looks for stale jobs
+REQUEUE_INTERVAL = 30
+POLL_INTERVAL = 0.5
+
+log = logging.getLogger(__name__)
+
+JOB_SECONDS = metrics.histogram('job_seconds', 'Background job run time.', ('type', 'status'))
+
+_handlers = {}
+_thread_workers = {}
+_thread_lock = threading.Lock()
+
+
+def handler(job_type):
+    """Register the function that runs jobs of `job_type`: fn(payload) -> JSON-able result."""
+    def register(fn):
+        _handlers[job_type] = fn
+        return fn
+    return register
+
+
+def _connect(db_path):
+    # Autocommit, so the explicit BEGIN IMMEDIATE below controls locking
+    return db.get_connection(db_path, autocommit=True)
+
+
+def dedupe_key(job_type, payload):
+    canonical = json.dumps(payload, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(f'{job_type}:{canonical}'.encode('utf-8')).hexdigest()
+
+
+def enqueue(db_path, job_type, payload):
+    """
+    Queue a job and return its id. If an identical job (same type and payload)
+    is still queued or running, its id is returned instead of a new one.
+    """
+    key = dedupe_key(job_type, payload)
+    conn = _connect(db_path)
+    try:
+        conn.execute('BEGIN IMMEDIATE')
+        row = conn.execute('SELECT id FROM jobs WHERE dedupe_key = ? AND status IN (?, ?) LIMIT 1',
+                           (key, *ACTIVE)).fetchone()
+        if row:
+            conn.execute('COMMIT')
+            return row['id']
+        job_id = uuid.uuid4().hex
+        conn.execute('INSERT INTO jobs (id, type, dedupe_key, payload, status, created_at) VALUES (?, ?, ?, ?, ?, ?)',
+                     (job_id, job_type, key, json.dumps(payload), QUEUED, time.time()))
+        conn.execute('COMMIT')
+        return job_id
+    except Exception:
+        conn.execute('ROLLBACK')
+        raise
+
+
+def get(db_path, job_id):
+    """Job as a dict with decoded payload/result, or None."""
+    row = _connect(db_path).execute('SELECT * FROM jobs WHERE id = ?', (job_id,)).fetchone()
+    if row is None:
+        return None
+    job = dict(row)
+    job['payload'] = json.loads(job['payload']) if job['payload'] else None
+    job['result'] = json.loads(job['result']) if job['result'] else None
+    return job
+
+
+def claim(db_path, limits, worker_id):
+    """
+    Atomically move the oldest queued job whose type is under its concurrency
+    cap to 'running'. `limits` maps job type -> max running jobs.
+    Returns the claimed job dict or None.
+    """
+    conn = _connect(db_path)
+    try:
+        conn.execute('BEGIN IMMEDIATE')
+        running = dict(conn.execute('SELECT type, COUNT(*) FROM jobs WHERE status = ? GROUP BY type', (RUNNING,)).fetchall())
+        open_types = [t for t, cap in limits.items() if running.get(t, 0) < cap and t in _handlers]
+        row = None
+        if open_types:
+            marks = ','.join('?' * len(open_types))
+            row = conn.execute(f'SELECT * FROM jobs WHERE status = ? AND type IN ({marks}) ORDER BY created_at LIMIT 1',
+                               (QUEUED, *open_types)).fetchone()
+        if row is None:
+            conn.execute('COMMIT')
+            return None
+        now = time.time()
+        conn.execute('UPDATE jobs SET status = ?, started_at = ?, heartbeat_at = ?, worker = ? WHERE id = ?',
+                     (RUNNING, now, now, worker_id, row['id']))
+        conn.execute('COMMIT')
+        job = dict(row)
+        job['payload'] = json.loads(job['payload']) if job['payload'] else None
+        return job
+    except Exception:
+        conn.execute('ROLLBACK')
+        raise
+
+
+def finish(db_path, job_id, result=None, error=None):
+    _connect(db_path).execute('UPDATE jobs SET status = ?, result = ?, error = ?, finished_at = ? WHERE id = ?',
+                              (FAILED if error else DONE, json.dumps(result) if result is not None else None,
+                               error, time.time(), job_id))
+
+
+def requeue_stale(db_path, older_than=STALE_AFTER):
+    """Put running jobs whose worker has stopped sending heartbeats back in the queue."""
+    cur = _connect(db_path).execute(
+        'UPDATE jobs SET status = ?, worker = NULL WHERE status = ? AND COALESCE(heartbeat_at, started_at) < ?',
+        (QUEUED, RUNNING, time.time() - older_than))
+    if cur.rowcount:
+        log.warning('Requeued stale jobs', extra={'count': cur.rowcount})
+    return cur.rowcount
+
+
+def _heartbeat(db_path, job_id, done):
+    while not done.wait(HEARTBEAT_INTERVAL):
+        try:
+            _connect(db_path).execute('UPDATE jobs SET heartbeat_at = ? WHERE id = ? AND status = ?',
+                                      (time.time(), job_id, RUNNING))
+        except sqlite3.OperationalError as e:
+            log.error('Job heartbeat failed', extra={'job_id': job_id, 'error': str(e)})
+    db.close_all()
+
+
+def execute(db_path, job):
+    """Run one claimed job through its handler, with a heartbeat while it runs, and record the outcome."""
+    fn = _handlers[job['type']]
+    done = threading.Event()
+    threading.Thread(target=_heartbeat, args=(db_path, job['id'], done), daemon=True).start()
+    start = time.perf_counter()
+    try:
+        result = fn(job['payload'])
+    except Exception as e:
+        log.exception('Job failed', extra={'job_id': job['id'], 'job_type': job['type']})
+        JOB_SECONDS.observe(time.perf_counter() - start, type=job['type'], status=FAILED)
+        finish(db_path, job['id'], error=f'{type(e).__name__}: {e}')
+    else:
+        JOB_SECONDS.observe(time.perf_counter() - start, type=job['type'], status=DONE)
+        finish(db_path, job['id'], result=result)
+    finally:
+        done.set()
+
+
+def run_inline(db_path, job_id):
+    """Claim and run a specific queued job in the calling thread (eager mode)."""
+    job = get(db_path, job_id)
+    if job is None or job['status'] != QUEUED:
+        return job
+    now = time.time()
+    cur = _connect(db_path).execute(
+        'UPDATE jobs SET status = ?, started_at = ?, heartbeat_at = ?, worker = ? WHERE id = ? AND status = ?',
+        (RUNNING, now, now, 'inline', job_id, QUEUED))
+    if cur.rowcount == 1:
+        execute(db_path, job)
+    return get(db_path, job_id)
+
+
+def run_worker(db_path, limits, stop_event=None, poll_interval=POLL_INTERVAL):
+    """Claim and run jobs until `stop_event` is set, requeueing jobs of dead workers as it goes."""
+    worker_id = f'{os.getpid()}:{threading.get_ident()}'
+    next_requeue = 0
+    while stop_event is None or not stop_event.is_set():
+        try:
+            if time.monotonic() >= next_requeue:
+                requeue_stale(db_path)
+                next_requeue = time.monotonic() + REQUEUE_INTERVAL
+            job = claim(db_path, limits, worker_id)
+        except sqlite3.OperationalError as e:
+            log.error('Job claim failed', extra={'error': str(e)})
+            job = None
+        if job is None:
+            time.sleep(poll_interval)
+            continue
+        execute(db_path, job)
+
+
+def start_thread_workers(db_path, limits, count):
+    """
+    Start `count` daemon worker threads in this process, once per process.
+    Used when no separate worker processes are running.
+    """
+    pid = os.getpid()
+    with _thread_lock:
+        if pid in _thread_workers:
+            return
+        threads = []
+        for _ in range(count):
+            t = threading.Thread(target=run_worker, args=(db_path, limits), daemon=True)
+            t.start()
+            threads.append(t)
+        _thread_workers[pid] = threads
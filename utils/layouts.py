@@ -0,0 +1,163 @@
+"""
+Poster layouts as data. Each static/layouts/<name>.json describes one design:
+the background (a template image or a solid colour), the fonts it uses, static
+decorations drawn once into the layout's base layer, and the regions filled per
+poster (image, title, price, description):
+
+    {
+      "label": "Classic",
+      "template": "static/template.png",
+      "fonts": {"title": "static/fonts/Persona Aura.otf"},
+      "static": [{"type": "rect", "box": [16, 560, 260, 48], "fill": [0, 0, 0, 140], "radius": 10}],
+      "image": {"box": [190, 187, 240, 250]},
+      "title": {"box": [138, 40, 350, 70], "font": "title", "size": 50, "max_lines": 2, "fill": [255, 255, 0, 255]},
+      "price": {"at": [440, 300], "font": "price", "size": 29, "fill": [34, 139, 34, 255]},
+      ...
+    }
+
+Text regions either wrap and centre inside a "box" [x, y, w, h] (shrinking the
+font to fit "max_lines") or are drawn as one line at "at" [x, y].
+"""
+import json
+import os
+import re
+import threading
+
+LAYOUT_FOLDER = os.path.join('static', 'layouts')
+DEFAULT_LAYOUT = 'classic'
+DEFAULT_SIZE = (626, 626)
+TEXT_REGIONS = ('title', 'price', 'description')
+STATIC_TYPES = ('rect', 'text')
+
+_NAME_RE = re.compile(r'^[a-z0-9_-]+$')
+_layouts = {}
+_lock = threading.Lock()
+
+
+class LayoutError(ValueError):
+    pass
+
+
+def layout_path(name):
+    if not name or not _NAME_RE.match(name):
+        raise LayoutError(f'Invalid layout name: {name!r}')
+    return os.path.join(LAYOUT_FOLDER, f'{name}.json')
+
+
+def _colour(value, where):
+    if not isinstance(value, list) or len(value) not in (3, 4) or not all(isinstance(c, int) and 0 <= c <= 255 for c in value):
+        raise LayoutError(f'{where}: colours are [r, g, b] or [r, g, b, a] with values 0-255')
+    return tuple(value) + ((255,) if len(value) == 3 else ())
+
+
+def _box(value, where, length=4):
+    if not isinstance(value, list) or len(value) != length or not all(isinstance(v, (int, float)) for v in value):
+        raise LayoutError(f'{where}: expected {length} numbers')
+    return tuple(int(v) for v in value)
+
+
+def _text_element(spec, fonts, where):
+    if not isinstance(spec, dict):
+        raise LayoutError(f'{where}: expected an object')
+    if spec.get('font') not in fonts:
+        raise LayoutError(f'{where}: font must be one of {sorted(fonts)}')
+    element = {
+        'font': spec['font'],
+        'size': int(spec.get('size', 24)),
+        'fill': _colour(spec.get('fill', [255, 255, 255]), where),
+        'max_lines': int(spec.get('max_lines', 1)),
+    }
+    if 'box' in spec:
+        element['box'] = _box(spec['box'], f'{where}.box')
+    elif 'at' in spec:
+        element['at'] = _box(spec['at'], f'{where}.at', 2)
+    else:
+        raise LayoutError(f'{where}: needs a "box" or an "at" position')
+    return element
+
+
+def _parse(name, raw):
+    if not isinstance(raw, dict):
+        raise LayoutError(f'Layout {name}: expected a JSON object')
+    fonts = raw.get('fonts')
+    if not isinstance(fonts, dict) or not fonts:
+        raise LayoutError(f'Layout {name}: "fonts" must map font names to font files')
+    template = raw.get('template')
+    if template is not None and not os.path.isfile(template):
+        raise LayoutError(f'Layout {name}: template {template} not found')
+    layout = {
+        'name': name,
+        'label': raw.get('label') or name.replace('_', ' ').title(),
+        'template': template,
+        'background': _colour(raw.get('background', [255, 255, 255]), f'{name}.background'),
+        'size': _box(raw['size'], f'{name}.size', 2) if 'size' in raw else None,
+        'fonts': dict(fonts),
+        'image': {'box': _box((raw.get('image') or {}).get('box'), f'{name}.image.box')},
+        'static': [],
+    }
+    if template is None and layout['size'] is None:
+        layout['size'] = DEFAULT_SIZE
+    for region in TEXT_REGIONS:
+        layout[region] = _text_element(raw.get(region), fonts, f'{name}.{region}')
+    for i, item in enumerate(raw.get('static') or []):
+        where = f'{name}.static[{i}]'
+        kind = item.get('type') if isinstance(item, dict) else None
+        if kind not in STATIC_TYPES:
+            raise LayoutError(f'{where}: type must be one of {STATIC_TYPES}')
+        if kind == 'rect':
+            layout['static'].append({'type': 'rect', 'box': _box(item.get('box'), f'{where}.box'),
+                                     'fill': _colour(item.get('fill', [0, 0, 0, 0]), where),
+                                     'radius': int(item.get('radius', 0))})
+        else:
+            element = _text_element(item, fonts, where)
+            element.update(type='text', text=str(item.get('text', '')))
+            layout['static'].append(element)
+    return layout
+
+
+def load_layout(name=DEFAULT_LAYOUT):
+    """Parsed, validated layout `name`; re-read only when its file changes. Raises LayoutError."""
+    path = layout_path(name or DEFAULT_LAYOUT)
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        raise LayoutError(f'Unknown layout: {name}')
+    cached = _layouts.get(path)
+    if cached is not None and cached['mtime'] == mtime:
+        return cached
+    try:
+        with open(path, encoding='utf-8') as f:
+            raw = json.load(f)
+    except ValueError as e:
+        raise LayoutError(f'Layout {name}: invalid JSON ({e})')
+    layout = _parse(name or DEFAULT_LAYOUT, raw)
+    layout['path'] = path
+    layout['mtime'] = mtime
+    with _lock:
+        _layouts[path] = layout
+    return layout
+
+
+def available():
+    """[(name, label)] of every valid layout, the default first."""
+    try:
+        names = sorted(f[:-5] for f in os.listdir(LAYOUT_FOLDER) if f.endswith('.json'))
+    except FileNotFoundError:
+        return []
+    result = []
+    for name in names:
+        try:
+            result.append((name, load_layout(name)['label']))
+        except LayoutError:
+            continue
+    result.sort(key=lambda item: item[0] != DEFAULT_LAYOUT)
+    return result
+
+
+def asset_paths(layout):
+    """The layout file plus every template and font file it draws with."""
+    paths = [layout['path']]
+    if layout['template']:
+        paths.append(layout['template'])
+    paths.extend(layout['fonts'][face] for face in sorted(layout['fonts']))
+    return paths
@@ -0,0 +1,64 @@
+"""
+Logging setup. Modules log through logging.getLogger(__name__) and pass
+structured fields with `extra={...}`; LOG_FORMAT=json emits one JSON object
+per line with those fields, the default text format appends them as key=value.
+"""
+import json
+import logging
+import os
+import sys
+import time
+
+LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO')
+LOG_FORMAT = os.environ.get('LOG_FORMAT', 'text')
+# Libraries whose debug output would drown ours; they stay at INFO or above
+QUIET_LOGGERS = ('PIL', 'urllib3', 'werkzeug')
+
+# Attributes every LogRecord has; anything else came in through `extra`
+_RESERVED = set(vars(logging.LogRecord('', 0, '', 0, '', None, None))) | {'message', 'asctime'}
+
+
+def _fields(record):
+    return {k: v for k, v in vars(record).items() if k not in _RESERVED and not k.startswith('_')}
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            'ts': time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime(record.created)) + f'.{int(record.msecs):03d}Z',
+            'level': record.levelname.lower(),
+            'logger': record.name,
+            'msg': record.getMessage(),
+        }
+        entry.update(_fields(record))
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    def __init__(self):
+        super().__init__('%(asctime)s [%(levelname)s] %(name)s: %(message)s')
+
+    def format(self, record):
+        line = super().format(record)
+        fields = _fields(record)
+        if fields:
+            line += ' | ' + ' '.join(f'{k}={v}' for k, v in fields.items())
+        return line
+
+
+def configure(level=None, fmt=None):
+    """
+    Install one stderr handler on the root logger. Does nothing when the root
+    logger already has handlers (e.g. configured by gunicorn or a test runner).
+    """
+    root = logging.getLogger()
+    if root.handlers:
+        return
+    handler = logging.StreamHandler(sys.stderr)
+    handler.setFormatter(JsonFormatter() if (fmt or LOG_FORMAT) == 'json' else TextFormatter())
+    root.addHandler(handler)
+    root.setLevel((level or LOG_LEVEL).upper())
+    for name in QUIET_LOGGERS:
+        logging.getLogger(name).setLevel(max(root.level, logging.INFO))
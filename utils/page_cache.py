@@ -0,0 +1,362 @@
+"""
+TTL + LRU cache for scraped search and review pages.
+Pages are keyed on a normalised URL and kept in an in-memory LRU tier bounded
+by total bytes, with an optional SQLite tier that survives restarts.
+Expired entries are served stale for a grace window while a background
+refresh runs; refreshes use ETag / Last-Modified conditional requests.
+"""
+import logging
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+
+from utils import http_client, metrics
+
+# Seconds a page is considered fresh, per platform
+PLATFORM_TTLS = {
+    'flipkart': 15 * 60,
+    'amazon': 15 * 60,
+    'indiamart': 60 * 60,
+}
+DEFAULT_TTL = 10 * 60
+# Extra seconds an expired page may still be served while it is refreshed
+STALE_WHILE_REVALIDATE = 10 * 60
+MAX_MEMORY_BYTES = 64 * 1024 * 1024
+# On-disk tier: rows older than this are deleted (kept past the TTL so they can still be
+# revalidated with a conditional request), then the oldest go until the bodies fit the byte cap
+DISK_MAX_AGE = 24 * 60 * 60
+DISK_MAX_BYTES = 256 * 1024 * 1024
+# Writes between two purges of the on-disk tier
+PURGE_EVERY = 200
+# Query parameters that only track the visitor and never change the page
+TRACKING_PARAMS = {'otracker', 'otracker1', 'fm', 'iid', 'ssid', 'qh', 'ref', 'ref_', 'crid', 'sprefix', 'requestid'}
+
+log = logging.getLogger(__name__)
+
+FETCH_SECONDS = metrics.histogram('scraper_fetch_seconds', 'Page fetch time, by where the page came from.', ('platform', 'source'))
+
+
+class CachedResponse:
+    """The subset of requests.Response the scrapers use."""
+
+    def __init__(self, text, status_code=200, headers=None, from_cache=False):
+        self.text = text
+        self.status_code = status_code
+        self.headers = headers or {}
+        self.from_cache = from_cache
+
+
+class _Entry:
+    __slots__ = ('url', 'text', 'status', 'etag', 'last_modified', 'fetched_at', 'size')
+
+    def __init__(self, url, text, status, etag, last_modified, fetched_at):
+        self.url = url
+        self.text = text
+        self.status = status
+        self.etag = etag
+        self.last_modified = last_modified
+        self.fetched_at = fetched_at
+        self.size = len(text.encode('utf-8'))
+
+
+def normalize_url(url):
+    """Lowercase scheme/host, drop the fragment and tracking params, sort the query."""
+    parts = urlsplit(url.strip())
+    query = sorted((k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True)
+                   if k.lower() not in TRACKING_PARAMS and not k.lower().startswith('utm_'))
+    path = parts.path or '/'
+    return urlunsplit((parts.scheme.lower(), parts.netloc.lower(), path, urlencode(query), ''))
+
+
+def platform_of(url):
+    host = urlsplit(url).netloc.lower()
+    for platform in PLATFORM_TTLS:
+        if platform in host:
+            return platform
+    return None
+
+
+class MemoryTier:
+    """Thread-safe LRU bounded by the total size of the cached bodies."""
+
+    def __init__(self, max_bytes=MAX_MEMORY_BYTES):
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self.evictions = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None:
+                self._data.move_to_end(key)
+            return entry
+
+    def put(self, key, entry):
+        if entry.size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._data.pop(key, None)
+            if old is not None:
+                self.bytes -= old.size
+            self._data[key] = entry
+            self.bytes += entry.size
+            while self.bytes > self.max_bytes:
+                _, evicted = self._data.popitem(last=False)
+                self.bytes -= evicted.size
+                self.evictions += 1
+
+    def delete(self, key):
+        with self._lock:
+            old = self._data.pop(key, None)
+            if old is not None:
+                self.bytes -= old.size
+
+    def __len__(self):
+        return len(self._data)
+
+
+class SQLiteTier:
+    """On-disk tier; bodies are zlib-compressed and old rows are purged every PURGE_EVERY writes."""
+
+    def __init__(self, path, max_age=DISK_MAX_AGE, max_bytes=DISK_MAX_BYTES):
+        self.path = path
+        self.max_age = max_age
+        self.max_bytes = max_bytes
+        self.purged = 0
+        self._writes = 0
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        conn = self._conn()
+        conn.execute('''CREATE TABLE IF NOT EXISTS page_cache (
+            key TEXT PRIMARY KEY,
+            url TEXT,
+            body BLOB,
+            status INTEGER,
+            etag TEXT,
+            last_modified TEXT,
+            fetched_at REAL
+        )''')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_page_cache_fetched_at ON page_cache (fetched_at)')
+        conn.commit()
+        self.purge()
+
+    def _conn(self):
+        # Per thread and per process: a connection opened before a fork (gunicorn --preload)
+        # must not be used by the forked workers
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5)
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def get(self, key):
+        row = self._conn().execute(
+            'SELECT url, body, status, etag, last_modified, fetched_at FROM page_cache WHERE key = ?', (key,)).fetchone()
+        if row is None:
+            return None
+        url, body, status, etag, last_modified, fetched_at = row
+        return _Entry(url, zlib.decompress(body).decode('utf-8'), status, etag, last_modified, fetched_at)
+
+    def put(self, key, entry):
+        conn = self._conn()
+        conn.execute('INSERT OR REPLACE INTO page_cache (key, url, body, status, etag, last_modified, fetched_at) VALUES (?, ?, ?, ?, ?, ?, ?)',
+                     (key, entry.url, zlib.compress(entry.text.encode('utf-8'), 6), entry.status,
+                      entry.etag, entry.last_modified, entry.fetched_at))
+        conn.commit()
+        with self._lock:
+            self._writes += 1
+            due = self._writes % PURGE_EVERY == 0
+        if due:
+            self.purge()
+
+    def purge(self):
+        """Delete rows older than max_age, then the oldest rows until the bodies fit in max_bytes."""
+        conn = self._conn()
+        deleted = conn.execute('DELETE FROM page_cache WHERE fetched_at < ?', (time.time() - self.max_age,)).rowcount
+        total = conn.execute('SELECT COALESCE(SUM(LENGTH(body)), 0) FROM page_cache').fetchone()[0]
+        if total > self.max_bytes:
+            # Walk from the oldest row and cut where the newer rows alone fit
+            kept = 0
+            cutoff = None
+            for fetched_at, size in conn.execute('SELECT fetched_at, LENGTH(body) FROM page_cache ORDER BY fetched_at DESC'):
+                kept += size
+                if kept > self.max_bytes:
+                    cutoff = fetched_at
+                    break
+            if cutoff is not None:
+                deleted += conn.execute('DELETE FROM page_cache WHERE fetched_at <= ?', (cutoff,)).rowcount
+        conn.commit()
+        if deleted:
+            with self._lock:
+                self.purged += deleted
+            log.debug('Purged page cache rows', extra={'rows': deleted})
+        return deleted
+
+    def touch(self, key, fetched_at):
+        conn = self._conn()
+        conn.execute('UPDATE page_cache SET fetched_at = ? WHERE key = ?', (fetched_at, key))
+        conn.commit()
+
+    def delete(self, key):
+        conn = self._conn()
+        conn.execute('DELETE FROM page_cache WHERE key = ?', (key,))
+        conn.commit()
+
+
+class PageCache:
+    def __init__(self, max_bytes=MAX_MEMORY_BYTES, db_path=None, ttls=None, stale_window=STALE_WHILE_REVALIDATE,
+                 disk_max_bytes=DISK_MAX_BYTES):
+        self.memory = MemoryTier(max_bytes)
+        self.disk = SQLiteTier(db_path, max_bytes=disk_max_bytes) if db_path else None
+        self.ttls = dict(PLATFORM_TTLS, **(ttls or {}))
+        self.stale_window = stale_window
+        self._refreshing = set()
+        self._lock = threading.Lock()
+        self._stats = {'memory_hits': 0, 'disk_hits': 0, 'misses': 0, 'stale_served': 0,
+                       'revalidated': 0, 'not_modified': 0, 'bypassed': 0}
+
+    def _count(self, name):
+        with self._lock:
+            self._stats[name] += 1
+
+    def ttl_for(self, url):
+        return self.ttls.get(platform_of(url), DEFAULT_TTL)
+
+    def _lookup(self, key):
+        entry = self.memory.get(key)
+        if entry is not None:
+            return entry, 'memory_hits'
+        if self.disk is not None:
+            entry = self.disk.get(key)
+            if entry is not None:
+                self.memory.put(key, entry)
+                return entry, 'disk_hits'
+        return None, None
+
+    def _store(self, key, entry):
+        self.memory.put(key, entry)
+        if self.disk is not None:
+            self.disk.put(key, entry)
+
+    def _fetch(self, key, url, entry=None):
+        """Fetch `url`, conditionally when we hold a validator; returns the fresh entry."""
+        headers = {}
+        if entry is not None:
+            if entry.etag:
+                headers['If-None-Match'] = entry.etag
+            if entry.last_modified:
+                headers['If-Modified-Since'] = entry.last_modified
+        resp = http_client.get(url, headers=headers or None)
+        now = time.time()
+        if resp.status_code == 304 and entry is not None:
+            self._count('not_modified')
+            entry.fetched_at = now
+            self.memory.put(key, entry)
+            if self.disk is not None:
+                self.disk.touch(key, now)
+            return entry
+        fresh = _Entry(url, resp.text, resp.status_code, resp.headers.get('ETag'), resp.headers.get('Last-Modified'), now)
+        if resp.status_code == 200:
+            self._store(key, fresh)
+        return fresh
+
+    def _refresh_in_background(self, key, url, entry):
+        with self._lock:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+
+        def run():
+            try:
+                self._fetch(key, url, entry)
+                self._count('revalidated')
+            except Exception as e:
+                log.debug('Background refresh failed', extra={'url': url, 'error': str(e)})
+            finally:
+                with self._lock:
+                    self._refreshing.discard(key)
+
+        threading.Thread(target=run, daemon=True).start()
+
+    def get(self, url, cookies=None):
+        """Return a CachedResponse for `url`, fetching through http_client on a miss."""
+        start = time.perf_counter()
+        source = 'error'
+        try:
+            resp, source = self._get(url, cookies)
+            return resp
+        finally:
+            FETCH_SECONDS.observe(time.perf_counter() - start, platform=platform_of(url) or 'other', source=source)
+
+    def _get(self, url, cookies):
+        if cookies:
+            # Personalised pages are never shared
+            self._count('bypassed')
+            resp = http_client.get(url, cookies=cookies)
+            return CachedResponse(resp.text, resp.status_code, resp.headers), 'bypass'
+        key = normalize_url(url)
+        entry, tier = self._lookup(key)
+        if entry is not None:
+            age = time.time() - entry.fetched_at
+            ttl = self.ttl_for(url)
+            if age < ttl:
+                self._count(tier)
+                return CachedResponse(entry.text, entry.status, from_cache=True), tier.replace('_hits', '')
+            if age < ttl + self.stale_window:
+                self._count('stale_served')
+                self._refresh_in_background(key, url, entry)
+                return CachedResponse(entry.text, entry.status, from_cache=True), 'stale'
+        self._count('misses')
+        fresh = self._fetch(key, url, entry)
+        return CachedResponse(fresh.text, fresh.status, from_cache=fresh is entry), 'revalidated' if fresh is entry else 'network'
+
+    def invalidate(self, url):
+        key = normalize_url(url)
+        self.memory.delete(key)
+        if self.disk is not None:
+            self.disk.delete(key)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        hits = stats['memory_hits'] + stats['disk_hits'] + stats['stale_served']
+        lookups = hits + stats['misses']
+        stats['hit_rate'] = hits / lookups if lookups else 0.0
+        stats['entries'] = len(self.memory)
+        stats['memory_bytes'] = self.memory.bytes
+        stats['memory_max_bytes'] = self.memory.max_bytes
+        stats['evictions'] = self.memory.evictions
+        stats['disk_enabled'] = self.disk is not None
+        stats['disk_purged'] = self.disk.purged if self.disk is not None else 0
+        return stats
+
+
+_cache = PageCache()
+
+
+def configure(max_bytes=MAX_MEMORY_BYTES, db_path=None, ttls=None, stale_window=STALE_WHILE_REVALIDATE,
+              disk_max_bytes=DISK_MAX_BYTES):
+    """Replace the process-wide cache, e.g. to enable the SQLite tier."""
+    global _cache
+    _cache = PageCache(max_bytes=max_bytes, db_path=db_path, ttls=ttls, stale_window=stale_window,
+                       disk_max_bytes=disk_max_bytes)
+    return _cache
+
+
+def get(url, cookies=None):
+    return _cache.get(url, cookies=cookies)
+
+
+def invalidate(url):
+    _cache.invalidate(url)
+
+
+def stats():
+    return _cache.stats()
@@ -0,0 +1,108 @@
+"""
+Web-friendly variants of rendered posters.
+Next to the lossless PNG, every poster is encoded as WebP and optimised JPEG
+at full size and a few responsive widths. Encoders release the GIL, so the
+variants are encoded in parallel on a small thread pool.
+"""
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image
+
+# Widths (px) encoded in addition to the full poster size
+RESPONSIVE_WIDTHS = (320, 480)
+FORMATS = {
+    'webp': {'format': 'WEBP', 'mimetype': 'image/webp', 'options': {'quality': 80, 'method': 2}},
+    'jpeg': {'format': 'JPEG', 'mimetype': 'image/jpeg', 'options': {'quality': 85, 'optimize': True, 'progressive': True}},
+    'png': {'format': 'PNG', 'mimetype': 'image/png', 'options': {}},
+}
+# Formats that get variants; the PNG is the original and only exists at full size
+VARIANT_FORMATS = ('webp', 'jpeg')
+ENCODE_WORKERS = 4
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _get_pool():
+    global _pool
+    # A pool inherited through fork (batch render processes, gunicorn --preload) has no
+    # threads in the child, so each process starts its own
+    if _pool is None or _pool[0] != os.getpid():
+        with _pool_lock:
+            if _pool is None or _pool[0] != os.getpid():
+                _pool = (os.getpid(), ThreadPoolExecutor(max_workers=ENCODE_WORKERS, thread_name_prefix='poster-encode'))
+    return _pool[1]
+
+
+def variant_name(poster_filename, fmt, width=None):
+    """poster_ab12.png -> poster_ab12.webp (full size) or poster_ab12-320.webp."""
+    stem = os.path.splitext(poster_filename)[0]
+    ext = 'jpg' if fmt == 'jpeg' else fmt
+    return f'{stem}-{width}.{ext}' if width else f'{stem}.{ext}'
+
+
+def _encode(img, width, outputs):
+    """Resize once to `width` (None = full size) and save it in each (fmt, path) of `outputs`."""
+    if width and width < img.width:
+        img = img.resize((width, round(img.height * width / img.width)), Image.BICUBIC)
+    for fmt, path in outputs:
+        spec = FORMATS[fmt]
+        tmp_path = f'{path}.{threading.get_ident()}.tmp'
+        img.save(tmp_path, spec['format'], **spec['options'])
+        os.replace(tmp_path, path)
+
+
+def _variant_tasks(poster_folder, poster_filename, only_missing=False):
+    """[(width, [(fmt, path), ...]), ...] grouping variants by width so each size is resized once."""
+    tasks = []
+    for width in (None,) + RESPONSIVE_WIDTHS:
+        outputs = [(fmt, os.path.join(poster_folder, variant_name(poster_filename, fmt, width))) for fmt in VARIANT_FORMATS]
+        if only_missing:
+            outputs = [(fmt, path) for fmt, path in outputs if not os.path.exists(path)]
+        if outputs:
+            tasks.append((width, outputs))
+    return tasks
+
+
+def _run(img, tasks):
+    futures = [_get_pool().submit(_encode, img, width, outputs) for width, outputs in tasks]
+    for f in futures:
+        f.result()
+
+
+def save_poster(img, poster_path):
+    """Save the RGB poster as PNG plus every WebP/JPEG variant, encoding in parallel."""
+    folder, poster_filename = os.path.split(poster_path)
+    _run(img, [(None, [('png', poster_path)])] + _variant_tasks(folder, poster_filename))
+
+
+def ensure_variants(poster_folder, poster_filename):
+    """Create missing variants for a poster rendered before variants existed."""
+    tasks = _variant_tasks(poster_folder, poster_filename, only_missing=True)
+    path = os.path.join(poster_folder, poster_filename)
+    if tasks and os.path.exists(path):
+        with Image.open(path) as img:
+            rgb = img.convert('RGB')
+        _run(rgb, tasks)
+
+
+def pick_width(requested):
+    """Smallest responsive width covering `requested`, or None for full size."""
+    for width in sorted(RESPONSIVE_WIDTHS):
+        if requested and requested <= width:
+            return width
+    return None
+
+
+def negotiate(accept_mimetypes):
+    """
+    Format to serve for a werkzeug Accept header. WebP only when the client names it
+    (a bare */* does not mean it can decode WebP); otherwise JPEG, then PNG.
+    """
+    if accept_mimetypes['image/webp'] and 'image/webp' in {m for m, _ in accept_mimetypes}:
+        return 'webp'
+    if accept_mimetypes['image/jpeg'] or not accept_mimetypes:
+        return 'jpeg'
+    return 'png'
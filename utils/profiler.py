@@ -0,0 +1,64 @@
+"""
+Sampling profiler for slow requests.
+While a request is being profiled, one background thread samples its stack
+every few milliseconds via sys._current_frames(); the result is a count per
+collapsed stack ("file:function;file:function ..."), the input format of
+flame graph tools. Sampling costs nothing for threads not being profiled.
+"""
+import os
+import sys
+import threading
+import time
+from collections import Counter
+
+SAMPLE_INTERVAL = 0.005
+MAX_DEPTH = 40
+
+
+def _collapse(frame):
+    stack = []
+    while frame is not None and len(stack) < MAX_DEPTH:
+        code = frame.f_code
+        stack.append(f'{os.path.basename(code.co_filename)}:{code.co_name}')
+        frame = frame.f_back
+    return ';'.join(reversed(stack))
+
+
+class Sampler:
+    def __init__(self, interval=SAMPLE_INTERVAL):
+        self.interval = interval
+        self._samples = {}
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def start(self, thread_id=None):
+        """Begin sampling `thread_id` (default: the calling thread)."""
+        thread_id = thread_id or threading.get_ident()
+        with self._lock:
+            self._samples[thread_id] = Counter()
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='request-sampler', daemon=True)
+                self._thread.start()
+
+    def stop(self, thread_id=None):
+        """Stop sampling and return Counter({collapsed_stack: samples}); empty if not started."""
+        with self._lock:
+            return self._samples.pop(thread_id or threading.get_ident(), Counter())
+
+    def _run(self):
+        while True:
+            with self._lock:
+                if not self._samples:
+                    self._thread = None
+                    return
+                frames = sys._current_frames()
+                for thread_id, counts in self._samples.items():
+                    frame = frames.get(thread_id)
+                    if frame is not None:
+                        counts[_collapse(frame)] += 1
+            time.sleep(self.interval)
+
+
+def top_stacks(samples, limit=10):
+    """The `limit` most sampled stacks as 'count stack' lines."""
+    return [f'{count} {stack}' for stack, count in samples.most_common(limit)]
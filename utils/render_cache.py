@@ -0,0 +1,118 @@
+"""
+Content-addressed storage for uploads and rendered posters.
+Uploads are saved under the hash of their bytes, so identical images are
+stored once and different images with the same name never collide.
+Posters are keyed by a hash of their inputs plus the layout, template and font files,
+so a repeated request reuses the existing poster file and database row.
+"""
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+
+from werkzeug.utils import secure_filename
+
+from utils import layouts
+
+# Bump when the poster layout code changes so old renders are not reused
+RENDER_VERSION = 3
+CHUNK_SIZE = 64 * 1024
+# Largest image upload accepted (validated in image_ingest; also sizes the app's request body cap)
+MAX_IMAGE_BYTES = 20 * 1024 * 1024
+# Memoised file digests kept per process (uploads, templates, fonts)
+MAX_DIGESTS = 4096
+
+_digests = OrderedDict()
+_stats = {'hits': 0, 'misses': 0}
+_lock = threading.Lock()
+
+
+def file_digest(path):
+    """sha256 of a file, memoised on (path, size, mtime) in a bounded LRU."""
+    st = os.stat(path)
+    key = (os.path.abspath(path), st.st_size, st.st_mtime_ns)
+    with _lock:
+        digest = _digests.get(key)
+        if digest is not None:
+            _digests.move_to_end(key)
+            return digest
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+            h.update(chunk)
+    digest = h.hexdigest()
+    with _lock:
+        _digests[key] = digest
+        while len(_digests) > MAX_DIGESTS:
+            _digests.popitem(last=False)
+    return digest
+
+
+def store_upload(upload, folder):
+    """
+    Save a werkzeug FileStorage as <folder>/<sha256>.<ext>, hashing while streaming.
+    Returns (filename, path); an identical earlier upload is reused, not rewritten.
+    """
+    ext = os.path.splitext(secure_filename(upload.filename or ''))[1].lower()
+    os.makedirs(folder, exist_ok=True)
+    h = hashlib.sha256()
+    fd, tmp_path = tempfile.mkstemp(dir=folder, prefix='.upload-')
+    try:
+        with os.fdopen(fd, 'wb') as out:
+            for chunk in iter(lambda: upload.stream.read(CHUNK_SIZE), b''):
+                h.update(chunk)
+                out.write(chunk)
+        filename = f'{h.hexdigest()[:32]}{ext}'
+        path = os.path.join(folder, filename)
+        if os.path.exists(path):
+            os.remove(tmp_path)
+        else:
+            os.replace(tmp_path, path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return filename, path
+
+
+def assets_fingerprint(layout=layouts.DEFAULT_LAYOUT):
+    """Hash of the layout spec and the template and font files it draws with."""
+    parts = [f'{path}:{file_digest(path) if os.path.exists(path) else "missing"}'
+             for path in layouts.asset_paths(layouts.load_layout(layout))]
+    return hashlib.sha256('|'.join(parts).encode('utf-8')).hexdigest()
+
+
+def render_key(product_name, price, description, image_path, layout=layouts.DEFAULT_LAYOUT):
+    """Key identifying a poster: inputs, image bytes, layout, template, fonts and renderer version."""
+    payload = {
+        'v': RENDER_VERSION,
+        'layout': layout,
+        'name': product_name,
+        'price': price,
+        'description': description,
+        'image': file_digest(image_path) if image_path and os.path.exists(image_path) else None,
+        'assets': assets_fingerprint(layout),
+    }
+    return hashlib.sha256(json.dumps(payload, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+def lookup(conn, key, poster_folder, record=True):
+    """
+    Existing posters row for `key` whose file is still on disk, else None.
+    Counts a hit or miss unless `record` is False (re-checks of an already counted request).
+    """
+    row = conn.execute('SELECT * FROM posters WHERE render_key = ? ORDER BY id DESC LIMIT 1', (key,)).fetchone()
+    hit = row is not None and os.path.exists(os.path.join(poster_folder, row['poster_filename']))
+    if record:
+        with _lock:
+            _stats['hits' if hit else 'misses'] += 1
+    return row if hit else None
+
+
+def stats():
+    with _lock:
+        hits, misses = _stats['hits'], _stats['misses']
+    total = hits + misses
+    return {'hits': hits, 'misses': misses, 'hit_rate': hits / total if total else 0.0}
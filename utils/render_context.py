@@ -0,0 +1,212 @@
+"""
+Process-wide render context for poster generation.
+Each layout (see utils/layouts.py) is composed once per worker into a base
+layer holding its background and static decorations; a render copies that and
+only draws the product image and text. Sized fonts and text measurements are
+memoised so fitting text into a box is a binary search over font sizes instead
+of reloading a font and re-measuring at every step.
+"""
+import logging
+import os
+import threading
+import time
+
+from PIL import Image, ImageDraw, ImageFont
+
+from utils import layouts, metrics
+
+MIN_FONT_SIZE = 10
+# Cap on memoised text measurements before the cache is reset
+MAX_MEASUREMENTS = 50000
+
+log = logging.getLogger(__name__)
+
+POSTER_STAGE_SECONDS = metrics.histogram('poster_stage_seconds', 'Poster rendering time per stage '
+                                         '(template, font, image, layout, encode, db).', ('stage',))
+
+
+class RenderContext:
+    def __init__(self):
+        self._fonts = {}
+        self._bboxes = {}
+        self._bases = {}
+        self._missing_fonts = set()
+        self._lock = threading.Lock()
+
+    def base_layer(self, layout):
+        """
+        The layout's background with its static elements drawn in, composed once per
+        version of its assets (the layout file, template and fonts, by mtime) so it
+        always matches the assets the render key was computed from.
+        """
+        version = tuple(os.stat(path).st_mtime_ns if os.path.exists(path) else None
+                        for path in layouts.asset_paths(layout))
+        key = (layout['name'], version)
+        base = self._bases.get(key)
+        if base is None:
+            if any(k[0] == layout['name'] for k in self._bases):
+                # An asset changed since the last compose: reload this layout's fonts too
+                self._forget_fonts(layout['fonts'].values())
+            with POSTER_STAGE_SECONDS.time(stage='template'):
+                base = self._compose_base(layout)
+            with self._lock:
+                self._bases = {k: v for k, v in self._bases.items() if k[0] != layout['name']}
+                self._bases[key] = base
+        return base
+
+    def _compose_base(self, layout):
+        # Posters are saved without alpha, so drop it once here rather than on every render;
+        # drawing in RGBA mode onto an RGB image blends translucent fills
+        if layout['template']:
+            img = Image.open(layout['template']).convert('RGB')
+            if layout['size'] and img.size != layout['size']:
+                img = img.resize(layout['size'], Image.LANCZOS)
+        else:
+            img = Image.new('RGB', layout['size'], layout['background'][:3])
+        draw = ImageDraw.Draw(img, 'RGBA')
+        for item in layout['static']:
+            if item['type'] == 'rect':
+                x, y, w, h = item['box']
+                draw.rounded_rectangle((x, y, x + w - 1, y + h - 1), radius=item['radius'], fill=item['fill'])
+            else:
+                self.draw_text(draw, item['text'], item, layout['fonts'])
+        return img
+
+    def _forget_fonts(self, paths):
+        paths = set(paths)
+        with self._lock:
+            self._fonts = {k: v for k, v in self._fonts.items() if k[0] not in paths}
+            self._missing_fonts -= paths
+            # Measurements are keyed by font object id, which a reloaded font may reuse
+            self._bboxes.clear()
+
+    def canvas(self, layout):
+        """A fresh copy of the layout's base layer to draw on."""
+        return self.base_layer(layout).copy()
+
+    def prepare(self, layout):
+        """Compose the base layer and load each text region's font at its base size."""
+        self.base_layer(layout)
+        for region in layouts.TEXT_REGIONS:
+            element = layout[region]
+            self.font(layout['fonts'][element['font']], element['size'])
+
+    def scalable(self, path):
+        return path not in self._missing_fonts
+
+    def font(self, path, size):
+        """Memoised ImageFont for the font file at `path`; Pillow's default font if the file is missing."""
+        key = (path, size)
+        font = self._fonts.get(key)
+        if font is None:
+            start = time.perf_counter()
+            try:
+                font = ImageFont.truetype(path, size)
+            except OSError:
+                if path not in self._missing_fonts:
+                    log.warning('Font unavailable, using the default font', extra={'font': path})
+                    self._missing_fonts.add(path)
+                font = ImageFont.load_default()
+            POSTER_STAGE_SECONDS.observe(time.perf_counter() - start, stage='font')
+            with self._lock:
+                self._fonts[key] = font
+        return font
+
+    def draw_text(self, draw, text, element, fonts):
+        """
+        Draw `text` for a layout text element: wrapped, centred and shrunk to fit
+        its box, or as a single line at its position.
+        """
+        path = fonts[element['font']]
+        if 'at' in element:
+            draw.text(element['at'], text, font=self.font(path, element['size']), fill=element['fill'])
+            return
+        x, y, w, h = element['box']
+        font, lines = self.fit_text(text, path, element['size'], w, element['max_lines'])
+        boxes = [self.bbox(font, line) for line in lines]
+        total_height = sum(b[3] - b[1] for b in boxes)
+        y_start = y + (h - total_height) // 2
+        for line, bbox in zip(lines, boxes):
+            line_w = bbox[2] - bbox[0]
+            draw.text((x + (w - line_w) // 2, y_start), line, font=font, fill=element['fill'])
+            y_start += bbox[3] - bbox[1]
+
+    def bbox(self, font, text):
+        """Memoised font.getbbox(text), the same box ImageDraw.textbbox((0, 0), ...) returns."""
+        key = (id(font), text)
+        box = self._bboxes.get(key)
+        if box is None:
+            box = font.getbbox(text)
+            with self._lock:
+                if len(self._bboxes) >= MAX_MEASUREMENTS:
+                    self._bboxes.clear()
+                self._bboxes[key] = box
+        return box
+
+    def wrap(self, text, font, width):
+        """Greedy word wrap, measuring each candidate line against `width`."""
+        lines, line = [], ""
+        for word in text.split():
+            test_line = f"{line} {word}".strip()
+            if self.bbox(font, test_line)[2] <= width:
+                line = test_line
+            else:
+                lines.append(line)
+                line = word
+        if line:
+            lines.append(line)
+        return lines
+
+    def fit_text(self, text, path, base_size, width, max_lines):
+        """
+        Largest font size in [MIN_FONT_SIZE, base_size] whose wrapped text fits in
+        `max_lines`, found by binary search. If even the smallest size overflows,
+        its lines are truncated. Returns (font, lines).
+        """
+        font = self.font(path, base_size)
+        if not self.scalable(path):
+            return font, self.wrap(text, font, width)[:max_lines]
+
+        def attempt(size):
+            font = self.font(path, size)
+            return font, self.wrap(text, font, width)
+
+        font, lines = attempt(base_size)
+        if len(lines) <= max_lines or base_size <= MIN_FONT_SIZE:
+            return font, lines[:max_lines]
+        low_font, low_lines = attempt(MIN_FONT_SIZE)
+        if len(low_lines) > max_lines:
+            return low_font, low_lines[:max_lines]
+        # Invariant: `low` fits, `high` does not
+        low, high = MIN_FONT_SIZE, base_size
+        best = (low_font, low_lines)
+        while high - low > 1:
+            mid = (low + high) // 2
+            mid_font, mid_lines = attempt(mid)
+            if len(mid_lines) <= max_lines:
+                low, best = mid, (mid_font, mid_lines)
+            else:
+                high = mid
+        return best
+
+
+_context = None
+_context_lock = threading.Lock()
+
+
+def get_render_context():
+    """Return the worker's render context; layouts and fonts load on first use."""
+    global _context
+    if _context is None:
+        with _context_lock:
+            if _context is None:
+                _context = RenderContext()
+    return _context
+
+
+def prepare_layouts(names=None):
+    """Compose base layers and load fonts for `names` (default: every layout) now instead of on first render."""
+    ctx = get_render_context()
+    for name in names or [name for name, _ in layouts.available()]:
+        ctx.prepare(layouts.load_layout(name))
+    return ctx
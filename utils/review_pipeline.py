@@ -0,0 +1,106 @@
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed, TimeoutError as FuturesTimeout
+from urllib.parse import urlparse
+
+from utils import metrics
+from utils.poster_maker import extract_reviews, analyze_sentiment, is_mock_reviews
+
+NEUTRAL_SENTIMENT = {'positive': 0.0, 'negative': 0.0, 'neutral': 1.0, 'avg': 0.0}
+
+log = logging.getLogger(__name__)
+
+REVIEW_FETCH_SECONDS = metrics.histogram('review_fetch_seconds', 'Review page fetch and extraction time per product.', ('platform',))
+REVIEW_SOURCES = metrics.counter('review_sources', 'Products scored, by review source (real, mock, deadline).', ('platform', 'source'))
+
+
+def _host_of(url):
+    try:
+        return urlparse(url).netloc.lower() or None
+    except Exception:
+        return None
+
+
+def _fetch_reviews(product, host_limit):
+    """Fetch reviews for one product while holding a slot for its host."""
+    with host_limit:
+        start = time.perf_counter()
+        try:
+            return extract_reviews(product.get('product_url'), product.get('platform'))
+        finally:
+            REVIEW_FETCH_SECONDS.observe(time.perf_counter() - start, platform=(product.get('platform') or 'other').lower())
+
+
+def _mock_reviews():
+    return extract_reviews(None, 'indiamart')
+
+
+def analyze_reviews(product, reviews, used_mock):
+    """Default scorer: sentiment of `reviews` via analyze_sentiment."""
+    sentiment, _ = analyze_sentiment(reviews)
+    return sentiment
+
+
+def _score(product, reviews, used_mock, scorer, source=None):
+    """Attach sentiment to a product dict, never raising."""
+    source = source or ('mock' if used_mock else 'real')
+    REVIEW_SOURCES.inc(platform=(product.get('platform') or 'other').lower(), source=source)
+    try:
+        sentiment = scorer(product, reviews, used_mock)
+        if isinstance(sentiment, float):
+            sentiment = dict(NEUTRAL_SENTIMENT, avg=sentiment)
+        product['sentiment'] = sentiment
+        log.debug('Product scored', extra={'product': product.get('name'), 'sentiment': product['sentiment'], 'source': source})
+    except Exception:
+        log.exception('Sentiment extraction failed', extra={'product': product.get('name')})
+        product['sentiment'] = dict(NEUTRAL_SENTIMENT)
+
+
+def score_products(products, max_workers=8, per_host=4, deadline=20.0, scorer=analyze_reviews):
+    """
+    Fetch reviews for every product in parallel and attach a 'sentiment' dict in place.
+    At most `per_host` requests hit the same host at once and the whole batch is
+    bounded by `deadline` seconds; products whose fetch fails or is still running
+    at the deadline are scored on mock reviews instead.
+    `scorer(product, reviews, used_mock)` turns reviews into a sentiment dict; it
+    always runs in the calling thread.
+    Returns the same list, in its original order.
+    """
+    if not products:
+        return products
+    host_limits = {}
+    pending = {}
+    executor = ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(products))))
+    try:
+        for idx, p in enumerate(products):
+            host = _host_of(p.get('product_url'))
+            host_limit = host_limits.setdefault(host, threading.BoundedSemaphore(per_host))
+            pending[executor.submit(_fetch_reviews, p, host_limit)] = idx
+        done = set()
+        try:
+            for future in as_completed(pending, timeout=deadline):
+                idx = pending[future]
+                done.add(idx)
+                p = products[idx]
+                try:
+                    reviews = future.result()
+                except Exception as e:
+                    log.error('Review fetch failed', extra={'product': p.get('name'), 'error': str(e)})
+                    reviews = []
+                # extract_reviews falls back to mock reviews itself when a page has none
+                used_mock = is_mock_reviews(reviews)
+                if not reviews and p.get('platform') and p['platform'].lower() in ('flipkart', 'amazon'):
+                    reviews = _mock_reviews()
+                    used_mock = True
+                log.debug('Reviews fetched', extra={'product': p.get('name'), 'count': len(reviews), 'mock': used_mock})
+                _score(p, reviews, used_mock, scorer)
+        except FuturesTimeout:
+            log.info('Review deadline reached, falling back to mock reviews',
+                     extra={'deadline': deadline, 'products': len(products) - len(done)})
+        for idx, p in enumerate(products):
+            if idx not in done:
+                _score(p, _mock_reviews(), True, scorer, source='deadline')
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+    return products
@@ -0,0 +1,159 @@
+"""
+Sentiment engine for review scoring.
+The model (VADER by default, TextBlob optionally) is loaded once per process,
+reviews are scored in batches, and polarity scores are memoised by a hash of
+the review text, so repeated reviews (e.g. the mock set) are never re-scored.
+"""
+import hashlib
+import logging
+import os
+import threading
+from collections import OrderedDict
+
+from utils import metrics
+
+DEFAULT_BACKEND = os.environ.get('SENTIMENT_BACKEND', 'vader')
+# Memoised scores kept per engine
+MAX_MEMO = 100000
+
+log = logging.getLogger(__name__)
+
+SCORE_SECONDS = metrics.histogram('sentiment_score_seconds', 'Model time per batch of reviews not seen before.', ('backend',))
+REVIEWS_SCORED = metrics.counter('sentiment_reviews', 'Reviews scored, by whether the model ran (scored) or the memo answered (memo).',
+                                 ('backend', 'result'))
+
+
+class VaderBackend:
+    name = 'vader'
+    # Conventional VADER cut-offs on the compound score
+    positive_threshold = 0.05
+    negative_threshold = -0.05
+
+    def __init__(self):
+        from vaderSentiment.vaderSentiment import SentimentIntensityAnalyzer
+        self._analyzer = SentimentIntensityAnalyzer()
+
+    def score(self, texts):
+        return [self._analyzer.polarity_scores(t)['compound'] for t in texts]
+
+
+class TextBlobBackend:
+    name = 'textblob'
+    positive_threshold = 0.2
+    negative_threshold = -0.2
+
+    def __init__(self):
+        from textblob import TextBlob
+        self._blob = TextBlob
+
+    def score(self, texts):
+        return [self._blob(t).sentiment.polarity for t in texts]
+
+
+BACKENDS = {
+    'vader': VaderBackend,
+    'textblob': TextBlobBackend,
+}
+
+
+def _text_key(text):
+    return hashlib.blake2b(text.encode('utf-8'), digest_size=16).digest()
+
+
+class SentimentEngine:
+    def __init__(self, backend=DEFAULT_BACKEND):
+        self.backend = BACKENDS[backend]()
+        self._memo = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def polarities(self, reviews):
+        """Polarity per review, scoring only texts not seen before, in one batch."""
+        keys = [_text_key(r) for r in reviews]
+        scores = {}
+        with self._lock:
+            for key in keys:
+                if key in self._memo:
+                    self._memo.move_to_end(key)
+                    scores[key] = self._memo[key]
+        pending = {}
+        for key, review in zip(keys, reviews):
+            if key not in scores and key not in pending:
+                pending[key] = review
+        if pending:
+            with SCORE_SECONDS.time(backend=self.backend.name):
+                fresh = self.backend.score(list(pending.values()))
+            with self._lock:
+                for key, polarity in zip(pending, fresh):
+                    self._memo[key] = polarity
+                    scores[key] = polarity
+                while len(self._memo) > MAX_MEMO:
+                    self._memo.popitem(last=False)
+        with self._lock:
+            self.misses += len(pending)
+            self.hits += len(keys) - len(pending)
+        REVIEWS_SCORED.inc(len(pending), backend=self.backend.name, result='scored')
+        REVIEWS_SCORED.inc(len(keys) - len(pending), backend=self.backend.name, result='memo')
+        return [scores[key] for key in keys]
+
+    def summarize(self, polarities):
+        """Share of positive/negative/neutral scores and their mean."""
+        if not polarities:
+            return {'positive': 0, 'negative': 0, 'neutral': 0, 'avg': 0.0}
+        pos = sum(1 for p in polarities if p >= self.backend.positive_threshold)
+        neg = sum(1 for p in polarities if p <= self.backend.negative_threshold)
+        total = len(polarities)
+        return {
+            'positive': pos / total,
+            'negative': neg / total,
+            'neutral': (total - pos - neg) / total,
+            'avg': sum(polarities) / total
+        }
+
+    def analyze(self, reviews):
+        """
+        Same contract as analyze_sentiment: returns
+        ({'positive', 'negative', 'neutral', 'avg'}, [(review, polarity), ...]).
+        """
+        if not reviews:
+            return self.summarize([]), []
+        polarities = self.polarities(reviews)
+        return self.summarize(polarities), list(zip(reviews, polarities))
+
+    def clear(self):
+        """Forget memoised scores."""
+        with self._lock:
+            self._memo.clear()
+
+    def stats(self):
+        with self._lock:
+            return {'backend': self.backend.name, 'memo_size': len(self._memo), 'hits': self.hits, 'misses': self.misses}
+
+
+_engines = {}
+_engines_lock = threading.Lock()
+
+
+def get_engine(backend=None):
+    """Return the process-wide engine for `backend`, loading its model on first use."""
+    backend = backend or DEFAULT_BACKEND
+    engine = _engines.get(backend)
+    if engine is None:
+        with _engines_lock:
+            engine = _engines.get(backend)
+            if engine is None:
+                engine = _engines[backend] = SentimentEngine(backend)
+    return engine
+
+
+def warm(backend=None):
+    """Load the model now (e.g. at worker start) instead of on the first request."""
+    try:
+        get_engine(backend)
+    except ImportError as e:
+        log.error('Sentiment backend unavailable', extra={'backend': backend or DEFAULT_BACKEND, 'error': str(e)})
+
+
+def analyze(reviews, backend=None):
+    return get_engine(backend).analyze(reviews)
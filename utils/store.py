@@ -0,0 +1,174 @@
+"""
+Persistent product, price and review store in poster_maker.db.
+Products are keyed by (platform, product_url); every price change is kept as
+an observation, and reviews are deduplicated by content hash so only reviews
+never seen before are scored. Searches remember which products they returned,
+so a fresh search can be served without scraping at all.
+"""
+import hashlib
+import json
+import re
+import time
+
+from utils import sentiment
+from utils.page_cache import normalize_url
+
+# Seconds a stored search result / a product's review sentiment stays fresh
+SEARCH_TTL = 15 * 60
+REVIEW_TTL = 6 * 60 * 60
+
+_PRICE_RE = re.compile(r'\d[\d,]*(?:\.\d+)?')
+
+
+def product_key(product):
+    """(platform, url) identifying a product; IndiaMART cards have no URL, so their name stands in."""
+    return product.get('platform') or '', product.get('product_url') or f"name:{product.get('name')}"
+
+
+def parse_price(price):
+    match = _PRICE_RE.search(price or '')
+    if not match:
+        return None
+    try:
+        return float(match.group(0).replace(',', ''))
+    except ValueError:
+        return None
+
+
+def review_hash(text):
+    return hashlib.sha1(text.strip().encode('utf-8')).hexdigest()
+
+
+class ProductStore:
+    def __init__(self, conn, search_ttl=SEARCH_TTL, review_ttl=REVIEW_TTL):
+        self.conn = conn
+        self.search_ttl = search_ttl
+        self.review_ttl = review_ttl
+        self._ids = {}
+
+    def _product_id(self, product):
+        key = product_key(product)
+        if key not in self._ids:
+            row = self.conn.execute('SELECT id FROM products WHERE platform = ? AND product_url = ?', key).fetchone()
+            self._ids[key] = row[0] if row else None
+        return self._ids[key]
+
+    def _row_to_product(self, row):
+        product = {
+            'name': row['name'],
+            'price': row['price'],
+            'description': row['description'],
+            'platform': row['platform'],
+        }
+        if not row['product_url'].startswith('name:'):
+            product['product_url'] = row['product_url']
+        if row['sentiment']:
+            product['sentiment'] = json.loads(row['sentiment'])
+        return product
+
+    def fresh_search(self, url):
+        """(products, message) for a search scraped within the TTL, else None."""
+        row = self.conn.execute('SELECT product_ids, message, scraped_at FROM searches WHERE url_key = ?',
+                                (normalize_url(url),)).fetchone()
+        if row is None or time.time() - row['scraped_at'] > self.search_ttl:
+            return None
+        ids = json.loads(row['product_ids'])
+        if ids:
+            marks = ','.join('?' * len(ids))
+            rows = {r['id']: r for r in self.conn.execute(f'SELECT * FROM products WHERE id IN ({marks})', ids)}
+            products = [self._row_to_product(rows[i]) for i in ids if i in rows]
+            # A search is only complete once every product has a sentiment
+            if len(products) != len(ids) or any('sentiment' not in p for p in products):
+                return None
+        else:
+            products = []
+        return products, row['message']
+
+    def upsert_products(self, products):
+        """Insert or refresh products and record a price observation whenever the price changed."""
+        now = time.time()
+        with self.conn:
+            for p in products:
+                platform, url = product_key(p)
+                self.conn.execute('''INSERT INTO products (platform, product_url, name, description, price, first_seen, last_seen)
+                    VALUES (?, ?, ?, ?, ?, ?, ?)
+                    ON CONFLICT (platform, product_url) DO UPDATE SET
+                        name = excluded.name, description = excluded.description,
+                        price = excluded.price, last_seen = excluded.last_seen''',
+                                  (platform, url, p.get('name'), p.get('description'), p.get('price'), now, now))
+                self._ids.pop((platform, url), None)
+                product_id = self._product_id(p)
+                last = self.conn.execute('SELECT price FROM price_observations WHERE product_id = ? ORDER BY observed_at DESC LIMIT 1',
+                                         (product_id,)).fetchone()
+                if last is None or last[0] != p.get('price'):
+                    self.conn.execute('INSERT INTO price_observations (product_id, price, price_value, observed_at) VALUES (?, ?, ?, ?)',
+                                      (product_id, p.get('price'), parse_price(p.get('price')), now))
+
+    def attach_fresh_sentiment(self, products):
+        """
+        Set 'sentiment' on products whose reviews were scored within the TTL.
+        Returns the products that still need their reviews fetched.
+        """
+        stale = []
+        cutoff = time.time() - self.review_ttl
+        for p in products:
+            row = self.conn.execute('SELECT sentiment, reviews_fetched_at FROM products WHERE id = ?',
+                                    (self._product_id(p),)).fetchone()
+            if row and row['sentiment'] and row['reviews_fetched_at'] and row['reviews_fetched_at'] >= cutoff:
+                p['sentiment'] = json.loads(row['sentiment'])
+            else:
+                stale.append(p)
+        return stale
+
+    def score_reviews(self, product, reviews, used_mock):
+        """
+        Scorer for review_pipeline.score_products: stores new reviews, scores only
+        those not seen before and returns the sentiment of the current review set.
+        Mock reviews (IndiaMART only ever has those) are scored but never stored.
+        """
+        engine = sentiment.get_engine()
+        product_id = self._product_id(product)
+        if used_mock or product_id is None or product.get('platform') == 'IndiaMART':
+            result = engine.summarize(engine.polarities(reviews))
+            if product_id is not None:
+                # IndiaMART never has real reviews, so its mock score counts as fetched;
+                # for other platforms the real reviews are retried on the next scrape
+                self._save_sentiment(product_id, result, fetched=product.get('platform') == 'IndiaMART')
+            return result
+        hashes = [review_hash(r) for r in reviews]
+        known = {}
+        if hashes:
+            marks = ','.join('?' * len(hashes))
+            known = dict(self.conn.execute(f'SELECT content_hash, polarity FROM reviews WHERE product_id = ? AND content_hash IN ({marks})',
+                                           (product_id, *hashes)).fetchall())
+        new = [(h, r) for h, r in dict(zip(hashes, reviews)).items() if h not in known]
+        if new:
+            scores = engine.polarities([r for _, r in new])
+            now = time.time()
+            with self.conn:
+                self.conn.executemany('INSERT OR IGNORE INTO reviews (product_id, content_hash, text, polarity, first_seen) VALUES (?, ?, ?, ?, ?)',
+                                      [(product_id, h, r, s, now) for (h, r), s in zip(new, scores)])
+            known.update((h, s) for (h, _), s in zip(new, scores))
+        result = engine.summarize([known[h] for h in hashes])
+        self._save_sentiment(product_id, result)
+        return result
+
+    def _save_sentiment(self, product_id, result, fetched=True):
+        with self.conn:
+            if fetched:
+                self.conn.execute('UPDATE products SET sentiment = ?, reviews_fetched_at = ? WHERE id = ?',
+                                  (json.dumps(result), time.time(), product_id))
+            else:
+                self.conn.execute('UPDATE products SET sentiment = ? WHERE id = ?', (json.dumps(result), product_id))
+
+    def record_search(self, url, products, message):
+        ids = [self._product_id(p) for p in products]
+        with self.conn:
+            self.conn.execute('INSERT OR REPLACE INTO searches (url_key, product_ids, message, scraped_at) VALUES (?, ?, ?, ?)',
+                              (normalize_url(url), json.dumps([i for i in ids if i is not None]), message, time.time()))
+
+    def price_history(self, platform, product_url, limit=100):
+        """Most recent price observations for one product, newest first."""
+        return [dict(r) for r in self.conn.execute('''SELECT o.price, o.price_value, o.observed_at FROM price_observations o
+            JOIN products p ON p.id = o.product_id WHERE p.platform = ? AND p.product_url = ?
+            ORDER BY o.observed_at DESC LIMIT ?''', (platform, product_url, limit))]